@@ -10,11 +10,11 @@ import logging
 # Загружаем переменные окружения
 load_dotenv()
 
-# Добавляем путь к проекту, чтобы импортировать database и models
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# Добавляем путь к исходникам, чтобы импортировать database и models
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
 
-from database import DATABASE_URL
-from models import BaseModel, SpimexTradingResult
+from database import Base, SYNC_DATABASE_URL as DATABASE_URL
+from models import SpimexDailyRollup, SpimexTradingResult
 
 # Конфигурация Alembic
 config = context.config
@@ -22,7 +22,7 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 # Метадата моделей
-target_metadata = BaseModel.metadata
+target_metadata = Base.metadata
 logger = logging.getLogger('alembic.runtime.migration')
 logger.info("=== Alembic sees the following tables ===")
 for tname in target_metadata.tables:
@@ -53,7 +53,7 @@ def run_migrations_online() -> None:
 
 
 if context.is_offline_mode():
-    print("💡 Зарегистрированные таблицы:", BaseModel.metadata.tables.keys())
+    print("💡 Зарегистрированные таблицы:", Base.metadata.tables.keys())
     run_migrations_offline()
 else:
     run_migrations_online()
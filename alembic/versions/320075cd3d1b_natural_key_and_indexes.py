@@ -0,0 +1,70 @@
+"""natural key and indexes
+
+Revision ID: 320075cd3d1b
+Revises: 0d05e7ad5a63
+Create Date: 2025-06-02 11:42:17.503914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '320075cd3d1b'
+down_revision: Union[str, None] = '0d05e7ad5a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Дубликаты по естественному ключу не дадут создать уникальный индекс
+    op.execute(
+        """
+        DELETE FROM spimex_trading_results a
+        USING spimex_trading_results b
+        WHERE a.date = b.date
+          AND a.exchange_product_id = b.exchange_product_id
+          AND a.id < b.id
+        """
+    )
+    # Раньше id проставлялся парсером, поэтому последовательность отстаёт от данных
+    op.execute(
+        """
+        SELECT setval(
+            pg_get_serial_sequence('spimex_trading_results', 'id'),
+            COALESCE((SELECT MAX(id) FROM spimex_trading_results), 0) + 1,
+            false
+        )
+        """
+    )
+    op.create_unique_constraint(
+        'uq_spimex_trading_results_date_product',
+        'spimex_trading_results',
+        ['date', 'exchange_product_id'],
+    )
+    op.create_index(
+        'ix_spimex_trading_results_oil_id_date',
+        'spimex_trading_results',
+        ['oil_id', 'date'],
+    )
+    op.create_index(
+        'ix_spimex_trading_results_delivery_type_id_date',
+        'spimex_trading_results',
+        ['delivery_type_id', 'date'],
+    )
+    op.create_index(
+        'ix_spimex_trading_results_delivery_basis_id_date',
+        'spimex_trading_results',
+        ['delivery_basis_id', 'date'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_spimex_trading_results_delivery_basis_id_date', table_name='spimex_trading_results')
+    op.drop_index('ix_spimex_trading_results_delivery_type_id_date', table_name='spimex_trading_results')
+    op.drop_index('ix_spimex_trading_results_oil_id_date', table_name='spimex_trading_results')
+    op.drop_constraint('uq_spimex_trading_results_date_product', 'spimex_trading_results', type_='unique')
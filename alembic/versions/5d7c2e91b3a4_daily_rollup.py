@@ -0,0 +1,52 @@
+"""daily rollup
+
+Revision ID: 5d7c2e91b3a4
+Revises: 8b1e4f2a9c07
+Create Date: 2025-06-09 10:17:33.618402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d7c2e91b3a4'
+down_revision: Union[str, None] = '8b1e4f2a9c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('spimex_daily_rollup',
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('oil_id', sa.String(), nullable=False),
+    sa.Column('delivery_basis_id', sa.String(), nullable=False),
+    sa.Column('delivery_type_id', sa.String(), nullable=False),
+    sa.Column('volume', sa.Float(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('updated_on', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('date', 'oil_id', 'delivery_basis_id', 'delivery_type_id')
+    )
+    # Первичное заполнение из уже загруженных данных, дальше итоги ведёт загрузка
+    op.execute(
+        """
+        INSERT INTO spimex_daily_rollup (
+            date, oil_id, delivery_basis_id, delivery_type_id,
+            volume, total, count, rows, updated_on
+        )
+        SELECT date, oil_id, delivery_basis_id, delivery_type_id,
+               SUM(volume), SUM(total), SUM(count), COUNT(*), now()
+        FROM spimex_trading_results
+        GROUP BY date, oil_id, delivery_basis_id, delivery_type_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('spimex_daily_rollup')
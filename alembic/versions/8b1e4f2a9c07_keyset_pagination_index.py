@@ -0,0 +1,33 @@
+"""keyset pagination index
+
+Revision ID: 8b1e4f2a9c07
+Revises: 320075cd3d1b
+Create Date: 2025-06-04 16:08:51.274310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b1e4f2a9c07'
+down_revision: Union[str, None] = '320075cd3d1b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Курсор (date, id) читается прямо по индексу в обе стороны
+    op.create_index(
+        'ix_spimex_trading_results_date_id',
+        'spimex_trading_results',
+        ['date', 'id'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_spimex_trading_results_date_id', table_name='spimex_trading_results')
@@ -0,0 +1,116 @@
+"""partition trading results by month
+
+Revision ID: a3f9d6c41e28
+Revises: 5d7c2e91b3a4
+Create Date: 2025-06-16 13:05:48.920377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f9d6c41e28'
+down_revision: Union[str, None] = '5d7c2e91b3a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_spimex_trading_results_date_id': ['date', 'id'],
+    'ix_spimex_trading_results_oil_id_date': ['oil_id', 'date'],
+    'ix_spimex_trading_results_delivery_type_id_date': ['delivery_type_id', 'date'],
+    'ix_spimex_trading_results_delivery_basis_id_date': ['delivery_basis_id', 'date'],
+}
+
+COLUMNS = """
+    id integer NOT NULL DEFAULT nextval('spimex_trading_results_id_seq'),
+    exchange_product_id varchar NOT NULL,
+    exchange_product_name varchar NOT NULL,
+    oil_id varchar NOT NULL,
+    delivery_basis_id varchar NOT NULL,
+    delivery_basis_name varchar NOT NULL,
+    delivery_type_id varchar NOT NULL,
+    volume float NOT NULL,
+    total float NOT NULL,
+    count integer NOT NULL,
+    date date NOT NULL,
+    created_on timestamp without time zone NOT NULL,
+    updated_on timestamp without time zone NOT NULL
+"""
+
+
+def _detach_old_table() -> None:
+    """Переименовывает текущую таблицу и освобождает имена индексов и последовательности."""
+    op.execute('ALTER TABLE spimex_trading_results RENAME TO spimex_trading_results_old')
+    op.execute('ALTER SEQUENCE spimex_trading_results_id_seq OWNED BY NONE')
+    op.execute('ALTER TABLE spimex_trading_results_old ALTER COLUMN id DROP DEFAULT')
+    for name in INDEXES:
+        op.drop_index(name, table_name='spimex_trading_results_old')
+    op.drop_constraint('uq_spimex_trading_results_date_product', 'spimex_trading_results_old', type_='unique')
+    op.drop_constraint('spimex_trading_results_pkey', 'spimex_trading_results_old', type_='primary')
+
+
+def _create_indexes() -> None:
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'spimex_trading_results', columns)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _detach_old_table()
+    op.execute(
+        f"""
+        CREATE TABLE spimex_trading_results (
+            {COLUMNS},
+            CONSTRAINT spimex_trading_results_pkey PRIMARY KEY (id, date),
+            CONSTRAINT uq_spimex_trading_results_date_product UNIQUE (date, exchange_product_id)
+        ) PARTITION BY RANGE (date)
+        """
+    )
+    op.execute('ALTER SEQUENCE spimex_trading_results_id_seq OWNED BY spimex_trading_results.id')
+    _create_indexes()
+
+    # Секции для всех месяцев, по которым уже есть данные; новые создаёт загрузка
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            month_start date;
+        BEGIN
+            FOR month_start IN
+                SELECT DISTINCT date_trunc('month', date)::date
+                FROM spimex_trading_results_old
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF spimex_trading_results FOR VALUES FROM (%L) TO (%L)',
+                    'spimex_trading_results_p' || to_char(month_start, 'YYYYMM'),
+                    month_start,
+                    (month_start + interval '1 month')::date
+                );
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute('INSERT INTO spimex_trading_results SELECT * FROM spimex_trading_results_old')
+    op.drop_table('spimex_trading_results_old')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _detach_old_table()
+    op.execute(
+        f"""
+        CREATE TABLE spimex_trading_results (
+            {COLUMNS},
+            CONSTRAINT spimex_trading_results_pkey PRIMARY KEY (id),
+            CONSTRAINT uq_spimex_trading_results_date_product UNIQUE (date, exchange_product_id)
+        )
+        """
+    )
+    op.execute('ALTER SEQUENCE spimex_trading_results_id_seq OWNED BY spimex_trading_results.id')
+    _create_indexes()
+    op.execute('INSERT INTO spimex_trading_results SELECT * FROM spimex_trading_results_old')
+    # Секции удаляются вместе с родительской таблицей
+    op.drop_table('spimex_trading_results_old')
@@ -0,0 +1,73 @@
+"""Сравнение сериализации списочных эндпоинтов: путь FastAPI и быстрый кодировщик.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_json_serialization.py
+"""
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from fast_json import encode_trading_results
+from models import SpimexTradingResult
+from trading_result_schema import TradingResultModel
+
+ROW_COUNTS = (10_000, 100_000)
+REPEATS = 3
+
+
+def make_rows(count: int) -> List[SpimexTradingResult]:
+    now = datetime(2025, 5, 27, 14, 11, 0, 123456)
+    return [
+        SpimexTradingResult(
+            id=i,
+            exchange_product_id=f"A{i % 1000:03d}NVY060F",
+            exchange_product_name="Бензин (АИ-92-К5) ст. Новый Уренгой",
+            oil_id="A100",
+            delivery_basis_id="NVY",
+            delivery_basis_name="ст. Новый Уренгой",
+            delivery_type_id="F",
+            volume=60.0 * (i % 7 + 1),
+            total=3_456_789.12 + i,
+            count=i % 9 + 1,
+            date=date(2023, 1, 1) + timedelta(days=i % 800),
+            created_on=now,
+            updated_on=now,
+        )
+        for i in range(count)
+    ]
+
+
+def fastapi_path(rows: List[SpimexTradingResult]) -> bytes:
+    """То, что делает FastAPI для response_model=List[TradingResultModel]."""
+    adapter = TypeAdapter(List[TradingResultModel])
+    validated = adapter.validate_python(rows, from_attributes=True)
+    return JSONResponse(adapter.dump_python(validated, mode="json")).body
+
+
+def measure(func, rows) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    for count in ROW_COUNTS:
+        rows = make_rows(count)
+        assert fastapi_path(rows) == encode_trading_results(rows), "ответы различаются"
+        before = measure(fastapi_path, rows)
+        after = measure(encode_trading_results, rows)
+        print(
+            f"{count:>7} строк: FastAPI {count / before:>10,.0f} строк/с, "
+            f"orjson {count / after:>10,.0f} строк/с, ускорение x{before / after:.1f}"
+        )
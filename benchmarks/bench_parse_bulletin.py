@@ -0,0 +1,117 @@
+"""Разбор листа бюллетеня: построчный путь с Pydantic и векторизованный.
+
+Лист строится в памяти в том виде, в каком его возвращает
+pd.read_excel(header=None): шапка, строка заголовков, строка единиц,
+секции инструментов со строками «Итого» и хвост после блока данных.
+Чтение XLS здесь не учитывается — только преобразование листа в записи.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_parse_bulletin.py
+"""
+import os
+import sys
+import time
+from datetime import date, datetime
+from typing import List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import pandas as pd
+from pydantic import TypeAdapter
+
+from bulletin_parser import REQUIRED_COLUMNS, bulletin_records
+from trading_result_schema import TradingResultCreate
+
+# Обычный бюллетень — несколько сотен инструментов, крупный — около двух тысяч
+ROW_COUNTS = (400, 2_000)
+REPEATS = 5
+TRADE_DATE = date(2024, 1, 15)
+
+
+def make_sheet(count: int) -> pd.DataFrame:
+    rows = [[None] * 16 for _ in range(6)]
+    rows[2][1] = "Бюллетень по итогам торгов в Секции «Нефтепродукты» АО «Биржа «Санкт-Петербург»"
+    rows[3][1] = f"Дата торгов: {TRADE_DATE:%d.%m.%Y}"
+    headers = list(REQUIRED_COLUMNS) + [f"Доп. колонка {i}" for i in range(9)]
+    rows.append([None] + headers)
+    rows.append([None, None, None, None, "Единица измерения"] + [None] * 11)
+    for i in range(count):
+        if i % 40 == 39:
+            rows.append([None, "Итого:", None, None, "-", "-", 12] + [None] * 9)
+            continue
+        basis = ("NVY", "ACH", "KRS", "UFM")[i % 4]
+        rows.append(
+            [
+                None,
+                f"A{i % 900:03d}{basis}06{'FJ'[i % 2]}",
+                f"Бензин (АИ-92-К5) ст. {basis}",
+                f"ст. {basis}",
+                60.0 * (i % 5) if i % 7 else "-",
+                3_456_789.12 + i,
+                i % 6,
+            ]
+            + [1.0] * 9
+        )
+    rows.append([None, "Итого по секции:", None, None, None, None, None] + [None] * 9)
+    rows.append([None] * 16)
+    rows.append([None, "Маклер"] + [None] * 14)
+    return pd.DataFrame(rows)
+
+
+def legacy_records(df: pd.DataFrame, trade_date: date) -> List[dict]:
+    """Прежний путь: строки через iloc, apply с split и модель Pydantic на строку."""
+    headers = [h.replace("\n", " ").strip() for h in df.iloc[6].fillna("").tolist()[1:]]
+    data_rows = []
+    for i in range(8, len(df)):
+        row = df.iloc[i].tolist()
+        if pd.isna(row[1]) or row[1] == "" or row[1].startswith("Код"):
+            break
+        data_rows.append(row[1:])
+    data_df = pd.DataFrame(data_rows, columns=headers)
+    for col in list(REQUIRED_COLUMNS)[3:]:
+        data_df[col] = pd.to_numeric(data_df[col].replace("-", pd.NA), errors="coerce").fillna(0)
+    data_df = data_df[data_df["Количество Договоров, шт."] > 0]
+    data_df = data_df[~data_df["Код Инструмента"].str.contains("Итог", case=False, na=False)]
+    data_df = data_df.rename(columns=REQUIRED_COLUMNS)[list(REQUIRED_COLUMNS.values())]
+    current_time = datetime.now()
+    data_df["date"] = trade_date
+    data_df["created_on"] = current_time
+    data_df["updated_on"] = current_time
+    data_df["oil_id"] = "UNKNOWN"
+    data_df["delivery_basis_id"] = data_df["exchange_product_id"].apply(
+        lambda x: x.split("-")[1] if isinstance(x, str) and len(x.split("-")) > 1 else "UNKNOWN"
+    )
+    data_df["delivery_type_id"] = data_df["exchange_product_id"].apply(
+        lambda x: x.split("-")[2] if isinstance(x, str) and len(x.split("-")) > 2 else "UNKNOWN"
+    )
+    adapter = TypeAdapter(List[TradingResultCreate])
+    records = adapter.validate_python(data_df.to_dict(orient="records"))
+    return [record.model_dump() for record in records]
+
+
+def without_timestamps(records: List[dict]) -> List[dict]:
+    return [{k: v for k, v in r.items() if k not in ("created_on", "updated_on")} for r in records]
+
+
+def measure(func, sheet) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(sheet, TRADE_DATE)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    for count in ROW_COUNTS:
+        sheet = make_sheet(count)
+        legacy = legacy_records(sheet, TRADE_DATE)
+        vectorized = bulletin_records(sheet, TRADE_DATE)
+        assert without_timestamps(legacy) == without_timestamps(vectorized), "записи различаются"
+        before = measure(legacy_records, sheet)
+        after = measure(bulletin_records, sheet)
+        print(
+            f"{count:>5} строк листа ({len(vectorized)} записей): построчно {before * 1000:>7.1f} мс, "
+            f"векторно {after * 1000:>6.1f} мс, ускорение x{before / after:.1f}"
+        )
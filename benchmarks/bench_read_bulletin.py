@@ -0,0 +1,69 @@
+"""Чтение XLS-бюллетеня: pd.read_excel всего листа и выборочное чтение xlrd.
+
+Нужны настоящие файлы бюллетеней: по умолчанию берутся bulletins/*.xls,
+которые скачивает загрузка (process_bulletins_async), либо пути из
+аргументов. Время — полный разбор файла в записи, чтение плюс
+преобразование.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_read_bulletin.py [файлы.xls ...]
+"""
+import glob
+import os
+import sys
+import time
+from datetime import date
+from typing import List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+import pandas as pd
+
+from bulletin_parser import block_records, bulletin_records, read_bulletin_block
+
+REPEATS = 5
+TRADE_DATE = date(2024, 1, 15)
+
+
+def read_excel_path(file_path: str) -> List[dict]:
+    return bulletin_records(pd.read_excel(file_path, sheet_name=0, header=None), TRADE_DATE, file_path)
+
+
+def targeted_path(file_path: str) -> List[dict]:
+    return block_records(read_bulletin_block(file_path), TRADE_DATE, file_path)
+
+
+def without_timestamps(records: List[dict]) -> List[dict]:
+    return [{k: v for k, v in r.items() if k not in ("created_on", "updated_on")} for r in records]
+
+
+def measure(func, file_path: str) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(file_path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    files = sys.argv[1:] or sorted(glob.glob("bulletins/*.xls"))
+    if not files:
+        sys.exit("Нет файлов: укажите пути к бюллетеням или скачайте их в bulletins/")
+    total_before = total_after = 0.0
+    for file_path in files:
+        records = targeted_path(file_path)
+        assert without_timestamps(read_excel_path(file_path)) == without_timestamps(records), "записи различаются"
+        before = measure(read_excel_path, file_path)
+        after = measure(targeted_path, file_path)
+        total_before += before
+        total_after += after
+        print(
+            f"{os.path.basename(file_path)} ({len(records)} записей): read_excel {before * 1000:>7.1f} мс, "
+            f"xlrd {after * 1000:>6.1f} мс, ускорение x{before / after:.1f}"
+        )
+    print(
+        f"В среднем на файл: read_excel {total_before / len(files) * 1000:.1f} мс, "
+        f"xlrd {total_after / len(files) * 1000:.1f} мс"
+    )
@@ -0,0 +1,68 @@
+from datetime import date
+from typing import List, Literal, Optional
+
+from fastapi import HTTPException
+from models import SpimexDailyRollup
+from sqlalchemy import Date, Select, cast, func, select
+
+Bucket = Literal["day", "week", "month"]
+
+AGGREGATE_DIMENSIONS = ("oil_id", "delivery_basis_id", "delivery_type_id")
+
+AGGREGATE_MEASURES = ("volume", "total", "count", "vwap")
+
+
+def parse_dimensions(group_by: Optional[str]) -> List[str]:
+    """Разбирает group_by=oil_id,delivery_basis_id в список измерений."""
+    if not group_by:
+        return []
+    requested = list(dict.fromkeys(d.strip() for d in group_by.split(",") if d.strip()))
+    unknown = [d for d in requested if d not in AGGREGATE_DIMENSIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные измерения: {', '.join(unknown)}. Доступны: {', '.join(AGGREGATE_DIMENSIONS)}",
+        )
+    return requested
+
+
+def aggregate_columns(dimensions: List[str]) -> List[str]:
+    return ["bucket", *dimensions, *AGGREGATE_MEASURES]
+
+
+def build_aggregate_query(
+    start_date: date,
+    end_date: date,
+    bucket: Bucket,
+    dimensions: List[str],
+    oil_id: Optional[str] = None,
+    delivery_type_id: Optional[str] = None,
+    delivery_basis_id: Optional[str] = None,
+) -> Select:
+    """Строит GROUP BY по временному окну и измерениям поверх дневных итогов."""
+    bucket_column = cast(func.date_trunc(bucket, SpimexDailyRollup.date), Date).label("bucket")
+    dimension_columns = [getattr(SpimexDailyRollup, d) for d in dimensions]
+    volume = func.sum(SpimexDailyRollup.volume)
+    total = func.sum(SpimexDailyRollup.total)
+
+    query = (
+        select(
+            bucket_column,
+            *dimension_columns,
+            volume.label("volume"),
+            total.label("total"),
+            func.sum(SpimexDailyRollup.count).label("count"),
+            (total / func.nullif(volume, 0)).label("vwap"),
+        )
+        .filter(SpimexDailyRollup.date >= start_date, SpimexDailyRollup.date <= end_date)
+        .group_by(bucket_column, *dimension_columns)
+        .order_by(bucket_column, *dimension_columns)
+    )
+
+    if oil_id:
+        query = query.filter(SpimexDailyRollup.oil_id == oil_id)
+    if delivery_type_id:
+        query = query.filter(SpimexDailyRollup.delivery_type_id == delivery_type_id)
+    if delivery_basis_id:
+        query = query.filter(SpimexDailyRollup.delivery_basis_id == delivery_basis_id)
+    return query
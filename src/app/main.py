@@ -1,65 +1,154 @@
-from fastapi import FastAPI, Depends, Query, BackgroundTasks
+from fastapi import FastAPI, Depends, Query, BackgroundTasks, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import get_db, sync_engine, Base
-from models import SpimexTradingResult
+from database import get_read_db, sync_engine, Base, AsyncSessionLocal, ReadSessionLocal
+from models import SpimexDailyRollup, SpimexTradingResult
 from sqlalchemy import select
 from datetime import date
-from typing import Optional, List
-from cache import cache_response, get_redis_client, clear_cache, schedule_cache_reset
+from typing import Optional, List, Literal
+from cache import (
+    AcceptEncodingMiddleware,
+    cache_response,
+    clear_cache,
+    close_redis,
+    current_data_version,
+    flush_popularity,
+    flush_popularity_periodically,
+    init_redis,
+    invalidate_tags,
+    listen_for_invalidations,
+    schedule_cache_reset,
+    sweep_stale_generations,
+    warm_cache,
+)
 import asyncio
+import logging
+from contextlib import asynccontextmanager
 from spimex_async import process_bulletins_async
 import os
 from datetime import datetime, timedelta
 from trading_result_schema import TradingResultModel
+from pagination import apply_keyset, split_page
+from fast_json import encode_trading_results, json_bytes_response
+from streaming import ENDPOINT_ROWS, stream_trading_results
+from projection import parse_fields, projection_query, projection_response
+from aggregation import aggregate_columns, build_aggregate_query, parse_dimensions
+from catalog import (
+    catalog_data_version,
+    catalog_refreshed_at,
+    get_catalog,
+    latest_trade_date,
+    record_refresh_failure,
+    refresh_allowed,
+    refresh_catalog,
+)
+from conditional import ConditionalGetMiddleware
+from config import CACHE_GENERATION_REFRESH, HISTORICAL_CACHE_TTL
+from metrics import RequestMetricsMiddleware, render_metrics
 
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
 
-cache_reset_task = None
+async def warm_popular_queries() -> None:
+    """Пересчитывает популярные запросы до прихода пользователей.
 
+    Прогрев идёт сразу после загрузки и сброса кеша, поэтому читает с
+    основной БД: отстающая реплика закешировала бы данные до загрузки.
+    """
+    await warm_cache(AsyncSessionLocal)
 
-@app.on_event("startup")
-async def startup_event():
-    global cache_reset_task
-    Base.metadata.create_all(bind=sync_engine)
-    # Проверка подключения к Redis при запуске
+
+async def load_catalog(session_factory=AsyncSessionLocal) -> None:
+    """Обновляет каталог измерений; ошибка БД не должна ронять API.
+
+    После загрузки каталог читается с основной БД (по той же причине, что и
+    прогрев); реплику использует только путь запроса.
+    """
+    # Версия читается до запросов: загрузка между ними вызовет ещё одно обновление, а не пропуск
+    data_version = await current_data_version()
     try:
-        redis_client = await get_redis_client()
-        if redis_client is None:
-            print(
-                "Предупреждение: Redis недоступен. API будет работать без кэширования."
-            )
-        else:
-            print("Успешное подключение к Redis.")
-            cache_reset_task = asyncio.create_task(schedule_cache_reset())
-            print("Запланирован ежедневный сброс кэша в 14:11")
+        async with session_factory() as session:
+            await refresh_catalog(session, data_version.version if data_version else None)
     except Exception as e:
-        print(f"Не удалось подключиться к Redis при запуске: {e}")
-        print("API будет работать без кэширования.")
+        record_refresh_failure()
+        logger.error(f"Не удалось обновить каталог измерений: {e}")
+
+
+async def refresh_catalog_if_stale() -> None:
+    """Перечитывает каталог, если загрузка (в любом процессе) увеличила версию данных.
+
+    Также повторяет неудавшуюся загрузку, но не чаще CATALOG_RETRY_INTERVAL.
+    """
+    if not refresh_allowed():
+        return
+    if catalog_refreshed_at() is not None:
+        data_version = await current_data_version()
+        if data_version is None or data_version.version == catalog_data_version():
+            return
+    await load_catalog()
+
+
+async def refresh_catalog_periodically(interval: float = CACHE_GENERATION_REFRESH):
+    """Следит за версией данных с тем же шагом, с каким воркер перечитывает её для ETag."""
+    while True:
+        await asyncio.sleep(interval)
+        await refresh_catalog_if_stale()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Пул Redis и фоновые задачи кеша живут столько же, сколько приложение."""
+    Base.metadata.create_all(bind=sync_engine)
+    await load_catalog()
+    if await init_redis() is None:
+        print(
+            "Предупреждение: Redis недоступен. API будет работать без кэширования, пока он не восстановится."
+        )
+    else:
+        print("Успешное подключение к Redis.")
+    # Задачи сами дожидаются Redis, если он поднимется позже
+    tasks = [
+        asyncio.create_task(schedule_cache_reset(on_reset=warm_popular_queries)),
+        asyncio.create_task(listen_for_invalidations()),
+        asyncio.create_task(sweep_stale_generations()),
+        asyncio.create_task(flush_popularity_periodically()),
+        asyncio.create_task(refresh_catalog_periodically()),
+    ]
+    print("Запланирован ежедневный сброс кэша в 14:11")
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await flush_popularity()
+        await close_redis()
 
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    global cache_reset_task
-    if cache_reset_task:
-        cache_reset_task.cancel()
-        try:
-            await cache_reset_task
-        except asyncio.CancelledError:
-            pass
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(AcceptEncodingMiddleware)
+app.add_middleware(
+    ConditionalGetMiddleware,
+    paths=("/get_last_trading_dates", "/get_dynamics", "/get_trading_results", "/catalog/"),
+)
+# Добавлен последним — внешний слой: замеряет и ответы 304, и сжатые ответы
+app.add_middleware(RequestMetricsMiddleware)
 
 
 @app.get("/get_last_trading_dates")
 @cache_response(key_prefix="last_trading_dates")
 async def get_last_trading_dates(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     count: Optional[int] = Query(10, description="Количество последних торговых дней"),
 ):
     """Список дат последних торговых дней (фильтрация по кол-ву последних торговых дней)."""
+    # Дневные итоги на порядки меньше сырой таблицы, а набор дат у них тот же
     query = (
-        select(SpimexTradingResult.date)
+        select(SpimexDailyRollup.date)
         .distinct()
-        .order_by(SpimexTradingResult.date.desc())
+        .order_by(SpimexDailyRollup.date.desc())
     )
     if count is not None:
         query = query.limit(count)
@@ -68,9 +157,25 @@ async def get_last_trading_dates(
     return {"last_trading_dates": last_trading_dates}
 
 
+def dynamics_ttl(cache_args: dict) -> Optional[int]:
+    """Диапазон, закончившийся до последней торговой даты, уже не изменится.
+
+    Такие ответы живут HISTORICAL_CACHE_TTL; диапазоны, задевающие последнюю
+    дату, истекают при ежедневном сбросе.
+    """
+    latest = latest_trade_date()
+    end_date = cache_args.get("end_date")
+    if latest is None or end_date is None:
+        return None
+    if date.fromisoformat(end_date) < latest:
+        return HISTORICAL_CACHE_TTL
+    return None
+
+
 @app.get("/get_dynamics", response_model=List[TradingResultModel])
+@cache_response(key_prefix="dynamics", ttl_resolver=dynamics_ttl)
 async def get_dynamics(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     start_date: date = Query(..., description="Дата начала периода (YYYY-MM-DD)"),
     end_date: date = Query(..., description="Дата окончания периода (YYYY-MM-DD)"),
     oil_id: Optional[str] = Query(None, description="Идентификатор нефти"),
@@ -80,9 +185,22 @@ async def get_dynamics(
     delivery_basis_id: Optional[str] = Query(
         None, description="Идентификатор базиса поставки"
     ),
+    limit: Optional[int] = Query(
+        None, ge=1, description="Размер страницы (без ограничения, если не задан)"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из заголовка X-Next-Cursor"
+    ),
+    output_format: Literal["json", "ndjson", "csv"] = Query(
+        "json", alias="format", description="Формат ответа: json, ndjson или csv (потоком)"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Только указанные колонки через запятую, например date,oil_id,total"
+    ),
 ):
     """Список торгов за заданный период (фильтрация по oil_id, delivery_type_id, delivery_basis_id, start_date, end_date)."""
-    query = select(SpimexTradingResult).filter(
+    columns = parse_fields(fields)
+    query = (select(SpimexTradingResult) if columns is None else projection_query(columns)).filter(
         SpimexTradingResult.date >= start_date, SpimexTradingResult.date <= end_date
     )
 
@@ -93,14 +211,63 @@ async def get_dynamics(
     if delivery_basis_id:
         query = query.filter(SpimexTradingResult.delivery_basis_id == delivery_basis_id)
 
-    result = await db.execute(query.order_by(SpimexTradingResult.date))
-    dynamics = result.scalars().all()
-    return dynamics
+    if output_format != "json":
+        return stream_trading_results(
+            apply_keyset(query, cursor, None), output_format, limit, columns, endpoint="dynamics"
+        )
+
+    result = await db.execute(apply_keyset(query, cursor, limit))
+    if columns is not None:
+        rows, next_cursor = split_page(result.all(), limit)
+        ENDPOINT_ROWS.observe(len(rows), endpoint="dynamics")
+        return projection_response(rows, columns, next_cursor)
+
+    # response_model описывает схему, но тело кодируется сразу в байты без повторной валидации
+    dynamics, next_cursor = split_page(result.scalars().all(), limit)
+    ENDPOINT_ROWS.observe(len(dynamics), endpoint="dynamics")
+    return json_bytes_response(encode_trading_results(dynamics), next_cursor)
+
+
+@app.get("/get_dynamics/aggregate")
+async def get_dynamics_aggregate(
+    db: AsyncSession = Depends(get_read_db),
+    start_date: date = Query(..., description="Дата начала периода (YYYY-MM-DD)"),
+    end_date: date = Query(..., description="Дата окончания периода (YYYY-MM-DD)"),
+    bucket: Literal["day", "week", "month"] = Query(
+        "day", description="Временное окно агрегации: day, week или month"
+    ),
+    group_by: Optional[str] = Query(
+        None, description="Измерения через запятую: oil_id, delivery_basis_id, delivery_type_id"
+    ),
+    oil_id: Optional[str] = Query(None, description="Идентификатор нефти"),
+    delivery_type_id: Optional[str] = Query(
+        None, description="Идентификатор типа поставки"
+    ),
+    delivery_basis_id: Optional[str] = Query(
+        None, description="Идентификатор базиса поставки"
+    ),
+):
+    """Суммы volume, total, count и VWAP по временным окнам (агрегация на стороне Postgres)."""
+    dimensions = parse_dimensions(group_by)
+    query = build_aggregate_query(
+        start_date,
+        end_date,
+        bucket,
+        dimensions,
+        oil_id=oil_id,
+        delivery_type_id=delivery_type_id,
+        delivery_basis_id=delivery_basis_id,
+    )
+    result = await db.execute(query)
+    rows = result.all()
+    ENDPOINT_ROWS.observe(len(rows), endpoint="dynamics_aggregate")
+    return projection_response(rows, aggregate_columns(dimensions))
 
 
 @app.get("/get_trading_results", response_model=List[TradingResultModel])
+@cache_response(key_prefix="trading_results")
 async def get_trading_results(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     oil_id: Optional[str] = Query(None, description="Идентификатор нефти"),
     delivery_type_id: Optional[str] = Query(
         None, description="Идентификатор типа поставки"
@@ -109,11 +276,21 @@ async def get_trading_results(
         None, description="Идентификатор базиса поставки"
     ),
     limit: Optional[int] = Query(
-        100, description="Максимальное количество результатов"
+        100, ge=1, description="Максимальное количество результатов"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы из заголовка X-Next-Cursor"
+    ),
+    output_format: Literal["json", "ndjson", "csv"] = Query(
+        "json", alias="format", description="Формат ответа: json, ndjson или csv (потоком)"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Только указанные колонки через запятую, например date,oil_id,total"
     ),
 ):
     """Список последних торгов (фильтрация по oil_id, delivery_type_id, delivery_basis_id)."""
-    query = select(SpimexTradingResult).order_by(SpimexTradingResult.date.desc())
+    columns = parse_fields(fields)
+    query = select(SpimexTradingResult) if columns is None else projection_query(columns)
 
     if oil_id:
         query = query.filter(SpimexTradingResult.oil_id == oil_id)
@@ -122,22 +299,65 @@ async def get_trading_results(
     if delivery_basis_id:
         query = query.filter(SpimexTradingResult.delivery_basis_id == delivery_basis_id)
 
-    if limit is not None:
-        query = query.limit(limit)
+    if output_format != "json":
+        return stream_trading_results(
+            apply_keyset(query, cursor, None, descending=True),
+            output_format,
+            limit,
+            columns,
+            endpoint="trading_results",
+        )
+
+    result = await db.execute(apply_keyset(query, cursor, limit, descending=True))
+    if columns is not None:
+        rows, next_cursor = split_page(result.all(), limit)
+        ENDPOINT_ROWS.observe(len(rows), endpoint="trading_results")
+        return projection_response(rows, columns, next_cursor)
+
+    trading_results, next_cursor = split_page(result.scalars().all(), limit)
+    ENDPOINT_ROWS.observe(len(trading_results), endpoint="trading_results")
+    return json_bytes_response(encode_trading_results(trading_results), next_cursor)
 
-    result = await db.execute(query)
-    trading_results = result.scalars().all()
-    return trading_results
+
+@app.get("/catalog/{dimension}")
+async def get_dimension_catalog(
+    dimension: Literal["oil_id", "delivery_basis_id", "delivery_type_id"],
+    prefix: Optional[str] = Query(None, description="Префикс значения для автодополнения"),
+):
+    """Справочник значений измерения с датами первых/последних торгов (из памяти, без запросов к БД)."""
+    # Пока БД недоступна, запросы не перечитывают каталог каждый раз — отдают пустой
+    if catalog_refreshed_at() is None and refresh_allowed():
+        await load_catalog(ReadSessionLocal)
+    refreshed_at = catalog_refreshed_at()
+    return {
+        "dimension": dimension,
+        "refreshed_at": refreshed_at.isoformat() if refreshed_at else None,
+        "values": get_catalog(dimension, prefix),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Метрики процесса в формате Prometheus: кеш, Redis, БД, задержки запросов, загрузка.
+
+    Счётчики живут в памяти воркера — при нескольких воркерах каждый отдаёт свои.
+    """
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.post("/clear_cache")
-async def clear_api_cache(pattern: str = "*"):
-    """Очищает кеш API по заданному шаблону."""
-    success = await clear_cache(pattern)
+async def clear_api_cache(pattern: str = "*", tag: Optional[str] = None):
+    """Очищает кеш API по заданному шаблону или тегу (например, endpoint:dynamics)."""
+    if tag is not None:
+        success = await invalidate_tags([tag])
+        target = f"тегу '{tag}'"
+    else:
+        success = await clear_cache(pattern)
+        target = f"шаблону '{pattern}'"
     if success:
         return {
             "status": "success",
-            "message": f"Кеш по шаблону '{pattern}' успешно очищен",
+            "message": f"Кеш по {target} успешно очищен",
         }
     else:
         return {"status": "error", "message": "Не удалось очистить кеш"}
@@ -145,6 +365,7 @@ async def clear_api_cache(pattern: str = "*"):
 
 @app.post("/run_spimex_async")
 async def run_spimex_async(
+    background_tasks: BackgroundTasks,
     start_date: str = "2024-01-01",
     end_date: str = "2024-01-31",
     output_dir: str = "bulletins",
@@ -154,6 +375,9 @@ async def run_spimex_async(
         start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
         end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
         await process_bulletins_async(start_dt, end_dt, output_dir)
+        await load_catalog()
+        # Загрузка сбросила затронутые ключи — прогреваем популярные запросы после ответа
+        background_tasks.add_task(warm_popular_queries)
         return {"status": "success", "message": "Обработка завершена"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
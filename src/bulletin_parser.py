@@ -0,0 +1,197 @@
+"""Разбор XLS-бюллетеня в записи для вставки.
+
+Модуль намеренно лёгкий — только pandas, xlrd и схема: его импортируют
+дочерние процессы пула разбора, и им не нужны движки БД, Redis и HTTP-клиент.
+"""
+import logging
+import time
+from datetime import date, datetime
+from typing import List, Optional
+
+import pandas as pd
+import xlrd
+from trading_result_schema import TradingResultCreate
+
+logger = logging.getLogger(__name__)
+
+
+# Колонки бюллетеня и соответствующие поля записи
+REQUIRED_COLUMNS = {
+    "Код Инструмента": "exchange_product_id",
+    "Наименование Инструмента": "exchange_product_name",
+    "Базис поставки": "delivery_basis_name",
+    "Объем Договоров в единицах измерения": "volume",
+    "Обьем Договоров, руб.": "total",
+    "Количество Договоров, шт.": "count",
+}
+TEXT_FIELDS = ("exchange_product_id", "exchange_product_name", "delivery_basis_name")
+NUMERIC_FIELDS = ("volume", "total", "count")
+RECORD_FIELDS = tuple(TradingResultCreate.model_fields)
+
+# Строка с заголовками и первая строка данных (после строки единиц измерения)
+HEADER_ROW = 6
+DATA_START_ROW = 8
+# В скольких первых строках искать заголовки при чтении через xlrd
+HEADER_SEARCH_ROWS = 30
+
+
+def parse_bulletin(file_path: str, trade_date: date) -> List[dict]:
+    start_time = time.time()
+    try:
+        # Проверка только расширения файла
+        if not file_path.lower().endswith(".xls"):
+            logger.error(f"Файл {file_path} не имеет расширение .xls")
+            return []
+
+        try:
+            data = read_bulletin_block(file_path)
+        except Exception as e:
+            # Не BIFF (например, xlsx с расширением .xls) — читаем весь лист через pandas
+            logger.warning(f"Выборочное чтение {file_path} не удалось ({e}), читаем лист целиком")
+            try:
+                df = pd.read_excel(file_path, sheet_name=0, header=None)
+            except Exception as e:
+                logger.error(f"Не удалось открыть файл {file_path} как Excel: {e}")
+                return []
+            result = bulletin_records(df, trade_date, file_path)
+        else:
+            result = [] if data is None else block_records(data, trade_date, file_path)
+        logger.info(
+            f"Спарсено {len(result)} записей из {file_path} за {time.time() - start_time:.2f} секунд"
+        )
+        return result
+
+    except Exception as e:
+        logger.error(f"Ошибка при парсинге {file_path}: {e}")
+        return []
+
+
+def _normalize_header(value) -> str:
+    return str(value).replace("\n", " ").strip()
+
+
+def _is_block_end(code) -> bool:
+    return code is None or code == "" or (isinstance(code, str) and code.startswith("Код"))
+
+
+def read_bulletin_block(file_path: str) -> Optional[pd.DataFrame]:
+    """Читает из XLS только блок данных и только нужные колонки.
+
+    pd.read_excel строит DataFrame из всего листа, хотя нужны шесть колонок
+    одного блока. Здесь xlrd с on_demand открывает один первый лист,
+    строка заголовков находится один раз, блок заканчивается на первой
+    пустой ячейке кода (за ней «Итого по секции» и служебные таблицы), и
+    в DataFrame попадают только срезы нужных колонок. Строки «Итого» внутри
+    блока отбрасывает block_records, как и при чтении через pandas.
+    Возвращает None, если заголовков нет.
+    """
+    book = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for header_row in range(min(sheet.nrows, HEADER_SEARCH_ROWS)):
+            headers = [_normalize_header(value) for value in sheet.row_values(header_row)]
+            if "Код Инструмента" in headers:
+                break
+        else:
+            logger.error(f"В файле {file_path} нет строки с заголовками")
+            return None
+
+        missing_cols = [col for col in REQUIRED_COLUMNS if col not in headers]
+        if missing_cols:
+            logger.error(f"Отсутствуют столбцы в {file_path}: {missing_cols}")
+            return None
+
+        start = header_row + 2
+        codes = sheet.col_values(headers.index("Код Инструмента"), start)
+        end = next((i for i, code in enumerate(codes) if _is_block_end(code)), len(codes))
+        # Пустые ячейки xlrd отдаёт как "", pandas — как NaN
+        return pd.DataFrame(
+            {
+                field: [None if value == "" else value for value in sheet.col_values(headers.index(col), start, start + end)]
+                for col, field in REQUIRED_COLUMNS.items()
+            }
+        )
+    finally:
+        book.release_resources()
+
+
+def bulletin_records(df: pd.DataFrame, trade_date: date, file_path: str = "") -> List[dict]:
+    """Записи из листа, прочитанного pd.read_excel(header=None) целиком.
+
+    Конец блока данных ищется маской, нужные колонки берутся по позициям.
+    """
+    if len(df) <= HEADER_ROW:
+        logger.error(f"Файл {file_path} слишком короткий, нет строки с заголовками")
+        return []
+
+    headers = [_normalize_header(h) for h in df.iloc[HEADER_ROW].fillna("").tolist()[1:]]
+    missing_cols = [col for col in REQUIRED_COLUMNS if col not in headers]
+    if missing_cols:
+        logger.error(f"Отсутствуют столбцы в {file_path}: {missing_cols}")
+        return []
+
+    # Блок данных кончается первой пустой ячейкой кода или повтором заголовка
+    codes = df.iloc[DATA_START_ROW:, 1]
+    stop = codes.isna().to_numpy() | codes.astype(str).str.startswith("Код").to_numpy() | (codes == "").to_numpy()
+    end = int(stop.argmax()) if stop.any() else len(stop)
+
+    positions = [headers.index(col) + 1 for col in REQUIRED_COLUMNS]
+    data = df.iloc[DATA_START_ROW : DATA_START_ROW + end, positions]
+    data.columns = list(REQUIRED_COLUMNS.values())
+    return block_records(data, trade_date, file_path)
+
+
+def block_records(data: pd.DataFrame, trade_date: date, file_path: str = "") -> List[dict]:
+    """Превращает блок данных бюллетеня в записи TradingResultCreate целыми колонками.
+
+    Идентификаторы базиса и типа поставки режутся str.split(expand=True), а
+    вместо модели Pydantic на каждую строку проверяются типы колонок.
+    Нарушение схемы — ValueError для всего файла, как прежде ValidationError.
+    """
+    if data.empty:
+        logger.warning(f"Нет данных в {file_path} после строки с заголовками")
+        return []
+
+    for field in NUMERIC_FIELDS:
+        data[field] = pd.to_numeric(data[field].replace("-", pd.NA), errors="coerce").fillna(0)
+
+    logger.debug(f"До фильтрации: {len(data)} строк")
+    keep = (data["count"] > 0) & ~data["exchange_product_id"].str.contains("Итог", case=False, na=False)
+    data = data[keep]
+    logger.debug(f"После фильтрации по количеству договоров и 'Итог': {len(data)} строк")
+
+    _validate_columns(data)
+
+    products = data["exchange_product_id"]
+    parts = products.str.split("-", expand=True)
+    columns = {field: data[field].tolist() for field in TEXT_FIELDS}
+    columns["volume"] = data["volume"].astype("float64").tolist()
+    columns["total"] = data["total"].astype("float64").tolist()
+    columns["count"] = data["count"].astype("int64").tolist()
+    for field, part in (("delivery_basis_id", 1), ("delivery_type_id", 2)):
+        columns[field] = (
+            parts[part].fillna("UNKNOWN").tolist() if part in parts.columns else ["UNKNOWN"] * len(data)
+        )
+
+    current_time = datetime.now()
+    constants = {
+        "oil_id": "UNKNOWN",
+        "date": trade_date,
+        "created_on": current_time,
+        "updated_on": current_time,
+    }
+    names = list(columns)
+    records = [{**dict(zip(names, row)), **constants} for row in zip(*columns.values())]
+    assert not records or set(records[0]) == set(RECORD_FIELDS), "поля записи расходятся со схемой"
+    return records
+
+
+def _validate_columns(data: pd.DataFrame) -> None:
+    """Проверки, которые раньше делал TypeAdapter(List[TradingResultCreate])."""
+    for field in TEXT_FIELDS:
+        column = data[field]
+        if column.isna().any() or pd.api.types.infer_dtype(column, skipna=True) not in ("string", "empty"):
+            raise ValueError(f"{field}: ожидаются непустые строки")
+    count = data["count"]
+    if (count != count.round()).any():
+        raise ValueError("count: ожидаются целые числа")
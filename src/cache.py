@@ -1,10 +1,50 @@
 import json
 import asyncio
-from datetime import datetime, time, timedelta
-from typing import Optional, Callable, Any
+import glob
+import gzip
+import inspect
+import re
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Callable, Any, Awaitable, Dict, Iterable, List, NamedTuple, Set, Tuple, Union
 import redis.asyncio as redis
 from redis.asyncio import Redis
-from config import REDIS_HOST, REDIS_PORT, REDIS_DB
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from pydantic import TypeAdapter
+from pydantic.fields import FieldInfo
+from starlette.responses import Response, StreamingResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from config import (
+    CACHE_COMPRESS_LEVEL,
+    CACHE_COMPRESS_MIN_BYTES,
+    CACHE_GENERATION_REFRESH,
+    CACHE_LOCK_TTL,
+    CACHE_LOCK_WAIT,
+    CACHE_POPULARITY_FLUSH,
+    CACHE_POPULARITY_SIZE,
+    CACHE_STALE_TTL,
+    CACHE_SWEEP_INTERVAL,
+    CACHE_WARM_CONCURRENCY,
+    CACHE_WARM_TOP_N,
+    LOCAL_CACHE_MAX_BYTES,
+    LOCAL_CACHE_MAX_ENTRIES,
+    LOCAL_CACHE_MAX_TTL,
+    REDIS_BREAKER_FAILURES,
+    REDIS_BREAKER_MAX_RESET,
+    REDIS_BREAKER_RESET,
+    REDIS_CONNECT_TIMEOUT,
+    REDIS_DB,
+    REDIS_HOST,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_PORT,
+    REDIS_POOL_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT,
+)
+from circuit_breaker import CircuitBreaker
+from local_cache import LocalTTLCache
+import metrics
 import logging
 import functools
 
@@ -12,29 +52,224 @@ logger = logging.getLogger(__name__)
 
 redis_client: Optional[Redis] = None
 
+# Пока Redis недоступен, запросы обходят кеш сразу, не дожидаясь таймаутов соединения
+redis_breaker = CircuitBreaker(
+    failure_threshold=REDIS_BREAKER_FAILURES,
+    reset_timeout=REDIS_BREAKER_RESET,
+    max_reset_timeout=REDIS_BREAKER_MAX_RESET,
+)
 
-async def get_redis_client() -> Redis:
+# Первый уровень кеша: память воркера, без сетевого запроса
+local_cache = LocalTTLCache(
+    max_entries=LOCAL_CACHE_MAX_ENTRIES,
+    max_bytes=LOCAL_CACHE_MAX_BYTES,
+    max_ttl=LOCAL_CACHE_MAX_TTL,
+)
+
+CACHE_HITS = metrics.Counter(
+    "spimex_cache_hits_total",
+    "Попадания в кеш: local — память воркера, redis, inflight — общий вызов в процессе, peer — результат другого воркера",
+    ("prefix", "tier"),
+)
+CACHE_MISSES = metrics.Counter("spimex_cache_misses_total", "Промахи кеша, посчитанные эндпоинтом", ("prefix",))
+CACHE_ERRORS = metrics.Counter(
+    "spimex_cache_errors_total", "Ошибки операций с кешем (prefix пуст для служебных операций)", ("prefix", "operation")
+)
+REDIS_LATENCY = metrics.Histogram("spimex_redis_command_duration_seconds", "Время выполнения команд Redis", ("command",))
+metrics.CallbackGauge(
+    "spimex_local_cache",
+    "Статистика локального кеша воркера: записи, байты, попадания, промахи, вытеснения",
+    lambda: {(name,): value for name, value in local_cache.stats().items()},
+    ("stat",),
+)
+metrics.CallbackGauge(
+    "spimex_redis_circuit_state",
+    "Состояние предохранителя Redis: 1 у текущего состояния",
+    lambda: {
+        (state,): float(redis_breaker.state == state)
+        for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+    },
+    ("state",),
+)
+
+# Канал, по которому clear_cache рассылает шаблоны сброса всем воркерам
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Поколения префиксов: ключ <prefix>:...:g<N>, сброс префикса — HINCRBY счётчика.
+# Ключи прошлых поколений больше не читаются, их в фоне удаляет sweep_stale_generations
+GENERATIONS_KEY = "cache:generations"
+_GENERATION_SUFFIX = re.compile(r":g(\d+)$")
+_SWEEP_BATCH_SIZE = 500
+
+_registered_prefixes: Set[str] = set()
+_generations: Dict[str, int] = {}
+_generations_loaded_at: Optional[float] = None
+_sweep_requested = asyncio.Event()
+
+# Версия данных для ETag/Last-Modified: растёт с каждой загрузкой бюллетеней
+DATA_VERSION_KEY = "cache:data_version"
+# Поле того же хеша: счётчик сбросов по тегам, растёт атомарно с удалением ключей
+INVALIDATION_EPOCH_FIELD = "invalidations"
+
+# Ежедневный сброс выполняет один воркер — тот, кто первым поставил ключ дня
+RESET_LOCK_PREFIX = "cache:reset:"
+RESET_LOCK_TTL = 12 * 3600
+
+# Популярность запросов: <prefix>:<аргументы> -> число обращений. Счётчики копятся
+# в памяти воркера и периодически сливаются в Redis, чтобы не добавлять запрос на каждый хит
+POPULARITY_KEY = "cache:popularity"
+_popularity: Counter = Counter()
+# Эндпоинты, которые умеет вызывать прогрев: префикс -> обёрнутая функция
+_warm_targets: Dict[str, Callable[..., Any]] = {}
+# Вызов идёт из прогрева и не должен засчитываться в популярность
+_warming: ContextVar[bool] = ContextVar("cache_warming", default=False)
+
+# Блокировка пересчёта ключа между воркерами и копия значения на время пересчёта
+LOCK_PREFIX = "lock:"
+STALE_PREFIX = "stale:"
+_LOCK_POLL_INTERVAL = 0.05
+
+# Снимает блокировку, только если она всё ещё наша (не истекла и не перехвачена)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Теги ключей: tag:<тег> — множество ключей кеша, зависящих от этих данных
+TAG_PREFIX = "tag:"
+# Диапазон длиннее этого числа месяцев помечается как зависящий от любых новых данных
+_MAX_MONTH_TAGS = 120
+
+# Добавляет ключ в множества тегов; TTL множества только продлевается
+_TAG_KEY_SCRIPT = """
+for _, tag in ipairs(KEYS) do
+    redis.call("sadd", tag, ARGV[1])
+    if redis.call("ttl", tag) < tonumber(ARGV[2]) then
+        redis.call("expire", tag, ARGV[2])
+    end
+end
+return #KEYS
+"""
+
+# Удаляет ключи из множеств тегов вместе с самими множествами и возвращает их.
+# KEYS[1] — хеш версии данных: счётчик сбросов увеличивается в той же операции
+_INVALIDATE_TAGS_SCRIPT = """
+redis.call("hincrby", KEYS[1], ARGV[1], 1)
+local keys = {}
+for i = 2, #KEYS do
+    local tag = KEYS[i]
+    for _, key in ipairs(redis.call("smembers", tag)) do
+        redis.call("unlink", key)
+        table.insert(keys, key)
+    end
+    redis.call("unlink", tag)
+end
+return keys
+"""
+
+# Вычисления, идущие в этом процессе: ключ кеша -> сериализованный результат
+_inflight: Dict[str, "asyncio.Future[Optional[str]]"] = {}
+
+
+async def get_redis_client() -> Optional[Redis]:
+    """Клиент Redis поверх общего пула; None — кеш сейчас нужно обойти.
+
+    Клиент создаётся один раз (обычно в lifespan приложения через init_redis)
+    и проверяется PING только при создании и в пробной попытке
+    предохранителя. Пока предохранитель разомкнут, возвращается None без
+    обращения к сети.
+    """
     global redis_client
-    if redis_client is None or not redis_client.ping():
+    if not redis_breaker.allow_request():
+        return None
+    probe = redis_client is None or redis_breaker.state == CircuitBreaker.HALF_OPEN
+    if redis_client is None:
+        # Блокирующий пул: при всплеске запросов команды ждут свободное
+        # соединение, а не получают «Too many connections»
+        pool = redis.BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=int(REDIS_PORT),
+            db=int(REDIS_DB),
+            # Значения кеша — байты (в том числе сжатые), строки декодируются на месте
+            decode_responses=False,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30,
+        )
+        redis_client = redis.Redis(connection_pool=pool)
+        _instrument(redis_client)
+    if probe:
         try:
-            redis_client = redis.Redis(
-                host=REDIS_HOST,
-                port=int(REDIS_PORT),
-                db=int(REDIS_DB),
-                decode_responses=True,
-                socket_connect_timeout=5,
-                socket_timeout=5,
-                retry_on_timeout=True,
-                health_check_interval=30
-            )
             await redis_client.ping()
+            redis_breaker.record_success()
             logger.info("Успешное подключение к Redis")
         except Exception as e:
+            redis_breaker.record_failure()
             logger.error(f"Ошибка подключения к Redis: {e}")
             return None
     return redis_client
 
 
+def _instrument(client: Redis) -> None:
+    """Замеряет одиночные команды клиента (они идут через execute_command); конвейеры не учитываются."""
+    execute_command = client.execute_command
+
+    async def timed_execute_command(*args, **options):
+        start = asyncio.get_running_loop().time()
+        try:
+            return await execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.observe(
+                asyncio.get_running_loop().time() - start, command=_text(args[0]).split(" ")[0].upper()
+            )
+
+    client.execute_command = timed_execute_command
+
+
+async def init_redis() -> Optional[Redis]:
+    """Создаёт пул соединений Redis при старте приложения."""
+    return await get_redis_client()
+
+
+async def close_redis() -> None:
+    """Закрывает клиент и пул соединений Redis при остановке приложения."""
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose(close_connection_pool=True)
+        redis_client = None
+
+
+def _key_prefix(cache_key: str) -> str:
+    return cache_key.partition(":")[0]
+
+
+def _redis_unavailable(error: Exception, operation: str, key_prefix: str = "") -> bool:
+    """Считает ошибку кеша; ошибку соединения учитывает в предохранителе.
+
+    True — Redis сейчас недоступен.
+    """
+    CACHE_ERRORS.inc(prefix=key_prefix, operation=operation)
+    if _pool_exhausted(error):
+        # Redis жив, заняты соединения воркера: обходим кеш, но цепь не размыкаем
+        return True
+    if isinstance(error, (RedisConnectionError, RedisTimeoutError)):
+        redis_breaker.record_failure()
+        return True
+    return False
+
+
+def _pool_exhausted(error: Exception) -> bool:
+    """Не дождались соединения из пула (BlockingConnectionPool) — это нагрузка, а не отказ Redis."""
+    return isinstance(error, RedisConnectionError) and str(error) in (
+        "No connection available.",
+        "Too many connections",
+    )
+
+
 def get_ttl_until_daily_reset() -> int:
     now = datetime.now()
     # Время сброса: 14:11
@@ -49,91 +284,871 @@ def get_ttl_until_daily_reset() -> int:
     return max(1, int(ttl))
 
 
+# Аргументы, которые не влияют на ответ и не попадают в ключ
+_EXCLUDED_ARGS = {"db"}
+
+# Маркер готового ответа в прежнем текстовом формате значений
+_RESPONSE_MARKER = "__response__"
+
+# Начало значения с готовым ответом: за ним JSON-заголовок, перевод строки и тело
+_PAYLOAD_MAGIC = b"\x00resp1"
+
+# Accept-Encoding текущего запроса; без AcceptEncodingMiddleware тело всегда распаковывается
+_accept_encoding: ContextVar[str] = ContextVar("accept_encoding", default="")
+
+
+def _resolve_default(parameter: inspect.Parameter) -> Any:
+    default = parameter.default
+    if isinstance(default, FieldInfo):
+        default = default.default
+    if default is inspect.Parameter.empty or default is ...:
+        return None
+    return default
+
+
+def normalize_cache_args(func: Callable[..., Any], args: tuple, kwargs: dict) -> Dict[str, Any]:
+    """Приводит аргументы вызова к каноническому виду для ключа кеша.
+
+    Позиционные аргументы привязываются к именам, пропущенные заполняются
+    значениями по умолчанию (в том числе из Query(...)), None отбрасываются,
+    даты приводятся к ISO. Порядок фильтров в URL и явно переданные значения
+    по умолчанию дают один и тот же ключ.
+    """
+    signature = inspect.signature(func)
+    try:
+        arguments = signature.bind_partial(*args, **kwargs).arguments
+    except TypeError:
+        arguments = dict(kwargs)
+
+    normalized = {}
+    for name, parameter in signature.parameters.items():
+        if name in _EXCLUDED_ARGS:
+            continue
+        value = arguments.get(name, _resolve_default(parameter))
+        if value is None:
+            continue
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        normalized[name] = value
+    return normalized
+
+
+def build_cache_key(
+    key_prefix: str, func: Callable[..., Any], cache_args: Dict[str, Any], generation: int = 0
+) -> str:
+    key = f"{key_prefix}:{func.__name__}:{json.dumps(cache_args, sort_keys=True, default=str)}"
+    # Нулевое поколение без суффикса: ключи, записанные до введения поколений, остаются валидными
+    return f"{key}:g{generation}" if generation else key
+
+
+def _key_generation(cache_key: str) -> int:
+    match = _GENERATION_SUFFIX.search(cache_key)
+    return int(match.group(1)) if match else 0
+
+
+def _stale_key(cache_key: str) -> str:
+    # Устаревшая копия не зависит от поколения и переживает сброс префикса
+    return f"{STALE_PREFIX}{_GENERATION_SUFFIX.sub('', cache_key)}"
+
+
+def _cached_generation(key_prefix: str) -> Optional[int]:
+    """Поколение префикса из памяти; None — счётчики пора перечитать из Redis."""
+    if _generations_loaded_at is None:
+        return None
+    if asyncio.get_running_loop().time() - _generations_loaded_at > CACHE_GENERATION_REFRESH:
+        return None
+    return _generations.get(key_prefix, 0)
+
+
+def _forget_generations() -> None:
+    global _generations_loaded_at
+    _generations_loaded_at = None
+
+
+async def _refresh_generations(redis_conn: Redis) -> None:
+    global _generations, _generations_loaded_at
+    stored = await redis_conn.hgetall(GENERATIONS_KEY)
+    _generations = {_text(prefix): int(value) for prefix, value in stored.items()}
+    _generations_loaded_at = asyncio.get_running_loop().time()
+
+
+class DataVersion(NamedTuple):
+    version: int
+    updated_at: Optional[datetime]
+
+
+_data_version: Optional[DataVersion] = None
+_data_version_loaded_at: Optional[float] = None
+
+
+def _forget_data_version() -> None:
+    global _data_version_loaded_at
+    _data_version_loaded_at = None
+
+
+async def current_data_version() -> Optional[DataVersion]:
+    """Версия данных из памяти воркера, перечитывается не чаще CACHE_GENERATION_REFRESH.
+
+    None — Redis недоступен и версия неизвестна.
+    """
+    global _data_version, _data_version_loaded_at
+    now = asyncio.get_running_loop().time()
+    if _data_version_loaded_at is not None and now - _data_version_loaded_at <= CACHE_GENERATION_REFRESH:
+        return _data_version
+    try:
+        redis_conn = await get_redis_client()
+        if redis_conn is None:
+            return None
+        version, updated_at = await redis_conn.hmget(DATA_VERSION_KEY, "version", "updated_at")
+    except Exception as e:
+        _redis_unavailable(e, "data_version")
+        logger.error(f"Ошибка чтения версии данных: {e}")
+        return None
+    _data_version = DataVersion(
+        int(version or 0), datetime.fromisoformat(_text(updated_at)) if updated_at else None
+    )
+    _data_version_loaded_at = now
+    return _data_version
+
+
+async def bump_data_version() -> Optional[DataVersion]:
+    """Увеличивает версию данных после загрузки — ETag всех ответов меняется."""
+    global _data_version, _data_version_loaded_at
+    updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+    try:
+        redis_conn = await get_redis_client()
+        if redis_conn is None:
+            logger.error("Невозможно обновить версию данных: Redis недоступен")
+            return None
+        async with redis_conn.pipeline(transaction=True) as pipe:
+            pipe.hincrby(DATA_VERSION_KEY, "version", 1)
+            pipe.hset(DATA_VERSION_KEY, "updated_at", updated_at.isoformat())
+            version, _ = await pipe.execute()
+    except Exception as e:
+        _redis_unavailable(e, "data_version")
+        logger.error(f"Ошибка обновления версии данных: {e}")
+        return None
+    _data_version = DataVersion(int(version), updated_at)
+    _data_version_loaded_at = asyncio.get_running_loop().time()
+    logger.info(f"Версия данных увеличена до {version}")
+    return _data_version
+
+
+async def _current_generation(redis_conn: Redis, key_prefix: str) -> int:
+    generation = _cached_generation(key_prefix)
+    if generation is None:
+        try:
+            await _refresh_generations(redis_conn)
+        except Exception as e:
+            _redis_unavailable(e, "generation", key_prefix)
+            logger.error(f"Ошибка чтения поколений кеша: {e}")
+        generation = _generations.get(key_prefix, 0)
+    return generation
+
+
+def _text(value: Union[bytes, str]) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _dump_cache_value(response_data: Any) -> Optional[bytes]:
+    """Сериализует результат эндпоинта; None — результат кешировать нельзя.
+
+    Готовый Response хранится как есть: заголовок с media_type и x-*
+    заголовками, затем тело, сжатое gzip, если оно не меньше
+    CACHE_COMPRESS_MIN_BYTES и сжатие действительно его уменьшает.
+    """
+    if isinstance(response_data, StreamingResponse):
+        return None
+    if isinstance(response_data, Response):
+        headers = {
+            name: value
+            for name, value in response_data.headers.items()
+            if name.lower().startswith("x-")
+        }
+        body = bytes(response_data.body)
+        encoding = "identity"
+        if len(body) >= CACHE_COMPRESS_MIN_BYTES:
+            compressed = gzip.compress(body, compresslevel=CACHE_COMPRESS_LEVEL, mtime=0)
+            if len(compressed) < len(body):
+                body, encoding = compressed, "gzip"
+        meta = json.dumps(
+            {"media_type": response_data.media_type, "headers": headers, "encoding": encoding}
+        ).encode()
+        return _PAYLOAD_MAGIC + meta + b"\n" + body
+    return json.dumps(response_data, default=str).encode()
+
+
+class CachedResponse(NamedTuple):
+    """Разобранный закешированный ответ; Response собирается заново на каждый запрос."""
+
+    body: bytes
+    media_type: Optional[str]
+    headers: Dict[str, str]
+    encoding: str = "identity"
+
+
+def _decode_cache_value(cached_data: Union[bytes, str]) -> Any:
+    if isinstance(cached_data, bytes) and cached_data.startswith(_PAYLOAD_MAGIC):
+        meta, body = cached_data[len(_PAYLOAD_MAGIC):].split(b"\n", 1)
+        return CachedResponse(body, **json.loads(meta))
+    data = json.loads(cached_data)
+    if isinstance(data, dict) and _RESPONSE_MARKER in data:
+        # Текстовый формат, записанный до перехода на байтовый
+        stored = data[_RESPONSE_MARKER]
+        return CachedResponse(stored["body"].encode(), stored["media_type"], stored["headers"])
+    return data
+
+
+def _accepts_gzip() -> bool:
+    """Принимает ли клиент gzip по Accept-Encoding (с учётом q=0 и *)."""
+    weights = {}
+    for item in _accept_encoding.get().split(","):
+        name, _, params = item.partition(";")
+        weight = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    return weights.get("gzip", weights.get("*", 0.0)) > 0
+
+
+def _materialize(value: Any) -> Any:
+    if isinstance(value, CachedResponse):
+        headers = dict(value.headers)
+        body = value.body
+        if value.encoding == "gzip":
+            headers["Vary"] = "Accept-Encoding"
+            if _accepts_gzip():
+                # Сжатое тело уходит клиенту без распаковки
+                headers["Content-Encoding"] = "gzip"
+            else:
+                body = gzip.decompress(body)
+        return Response(content=body, media_type=value.media_type, headers=headers)
+    return value
+
+
+def _load_cache_value(cached_data: Union[bytes, str]) -> Any:
+    return _materialize(_decode_cache_value(cached_data))
+
+
+class AcceptEncodingMiddleware:
+    """Запоминает Accept-Encoding запроса, чтобы попадание в кеш отдало сжатое тело как есть."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        value = dict(scope["headers"]).get(b"accept-encoding", b"")
+        token = _accept_encoding.set(value.decode("latin-1"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _accept_encoding.reset(token)
+
+
+def _month_starts(start: date, end: date) -> List[date]:
+    months = []
+    month = start.replace(day=1)
+    while month <= end:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def default_cache_tags(key_prefix: str, cache_args: Dict[str, Any]) -> List[str]:
+    """Теги ключа кеша: эндпоинт, месяцы торговых дат и oil_id.
+
+    Ответ без диапазона дат (или со слишком широким) зависит от последних
+    торгов и помечается тегом latest. Фильтр по oil_id сужает теги дат:
+    month:2024-05:oil:A100 вместо month:2024-05.
+    """
+    scopes = ["latest"]
+    start_date, end_date = cache_args.get("start_date"), cache_args.get("end_date")
+    if start_date and end_date:
+        months = _month_starts(date.fromisoformat(start_date), date.fromisoformat(end_date))
+        if len(months) <= _MAX_MONTH_TAGS:
+            scopes = [f"month:{month:%Y-%m}" for month in months]
+    oil_id = cache_args.get("oil_id")
+    if oil_id:
+        scopes = [f"{scope}:oil:{oil_id}" for scope in scopes]
+    return [f"endpoint:{key_prefix}", *scopes]
+
+
+def ingestion_tags(records: Iterable[dict]) -> List[str]:
+    """Теги, которые затрагивает загрузка записей: их месяцы, oil_id и latest."""
+    tags = {"latest"}
+    for record in records:
+        month = f"month:{record['date']:%Y-%m}"
+        oil_id = record["oil_id"]
+        tags.update((month, f"{month}:oil:{oil_id}", f"latest:oil:{oil_id}"))
+    return sorted(tags)
+
+
+async def _tag_cache_key(redis_conn: Redis, cache_key: str, tags: List[str], ttl: int) -> None:
+    tag_keys = [f"{TAG_PREFIX}{tag}" for tag in tags]
+    await redis_conn.eval(_TAG_KEY_SCRIPT, len(tag_keys), *tag_keys, cache_key, ttl)
+
+
+async def _wait_for_peer(redis_conn: Redis, cache_key: str) -> Optional[str]:
+    """Ждёт результат воркера, держащего блокировку ключа.
+
+    Если есть устаревшая копия, она отдаётся сразу (stale-while-revalidate),
+    иначе ключ опрашивается до CACHE_LOCK_WAIT секунд.
+    """
+    stale_data = await redis_conn.get(_stale_key(cache_key))
+    if stale_data:
+        logger.info(f"Ключ {cache_key} пересчитывается другим воркером, отдаём устаревшую копию")
+        return stale_data
+    deadline = asyncio.get_running_loop().time() + CACHE_LOCK_WAIT
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(_LOCK_POLL_INTERVAL)
+        cached_data = await redis_conn.get(cache_key)
+        if cached_data:
+            return cached_data
+    logger.warning(f"Не дождались пересчёта ключа {cache_key}, считаем сами")
+    return None
+
+
+async def _invalidation_epoch(redis_conn: Redis) -> Optional[bytes]:
+    return await redis_conn.hget(DATA_VERSION_KEY, INVALIDATION_EPOCH_FIELD)
+
+
+async def _compute_with_lock(
+    redis_conn: Redis,
+    cache_key: str,
+    compute: Callable[[], Awaitable[Any]],
+    resolve_ttl: Callable[[], int],
+    resolve_tags: Callable[[], List[str]],
+) -> Tuple[Any, Optional[str]]:
+    """Пересчитывает ключ под блокировкой в Redis, чтобы БД нагружал один воркер.
+
+    Возвращает результат эндпоинта и его сериализованный вид (None — не кешируется).
+
+    Если за время пересчёта прошёл сброс по тегам (invalidate_tags после
+    загрузки), результат не кешируется: он мог прочитать БД до фиксации
+    загрузки и вернул бы в кеш то, что сброс только что удалил.
+    """
+    lock_key = f"{LOCK_PREFIX}{cache_key}"
+    token = uuid.uuid4().hex
+    store = True
+    epoch = None
+    try:
+        locked = await redis_conn.set(lock_key, token, nx=True, px=int(CACHE_LOCK_TTL * 1000))
+        if not locked:
+            cached_data = await _wait_for_peer(redis_conn, cache_key)
+            if cached_data is not None:
+                CACHE_HITS.inc(prefix=_key_prefix(cache_key), tier="peer")
+                return _load_cache_value(cached_data), cached_data
+        epoch = await _invalidation_epoch(redis_conn)
+    except Exception as e:
+        logger.error(f"Ошибка блокировки ключа кеша {cache_key}: {e}")
+        locked = False
+        # Соединение потеряно — не ждём таймаутов ещё и на записи
+        store = not _redis_unavailable(e, "lock", _key_prefix(cache_key))
+
+    try:
+        CACHE_MISSES.inc(prefix=_key_prefix(cache_key))
+        # Исключения самого эндпоинта (например, HTTPException) пробрасываются как есть
+        response_data = await compute()
+        try:
+            cache_value = _dump_cache_value(response_data)
+            if cache_value is not None and store:
+                if await _invalidation_epoch(redis_conn) != epoch:
+                    logger.info(f"Кеш сброшен во время пересчёта {cache_key}, результат не кешируется")
+                    return response_data, None
+                ttl = resolve_ttl()
+                await redis_conn.setex(cache_key, ttl, cache_value)
+                await redis_conn.set(_stale_key(cache_key), cache_value, ex=ttl + CACHE_STALE_TTL)
+                await _tag_cache_key(redis_conn, cache_key, resolve_tags(), ttl)
+                if await _invalidation_epoch(redis_conn) != epoch:
+                    # Сброс прошёл между проверкой и записью — записанное могло устареть
+                    await redis_conn.unlink(cache_key, _stale_key(cache_key))
+                    logger.info(f"Кеш сброшен во время записи {cache_key}, запись удалена")
+                    return response_data, None
+                local_cache.set(cache_key, _decode_cache_value(cache_value), ttl, len(cache_value))
+                logger.info(
+                    f"Данные закешированы для ключа: {cache_key} с TTL: {ttl} секунд"
+                )
+        except Exception as e:
+            _redis_unavailable(e, "store", _key_prefix(cache_key))
+            logger.error(f"Ошибка при сохранении данных в кеш: {e}")
+            cache_value = None
+        return response_data, cache_value
+    finally:
+        if locked:
+            try:
+                await redis_conn.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                _redis_unavailable(e, "release", _key_prefix(cache_key))
+                logger.error(f"Ошибка снятия блокировки {lock_key}: {e}")
+
+
 def cache_response(
-    key_prefix: str, expiration_seconds: Optional[int] = None
+    key_prefix: str,
+    expiration_seconds: Optional[int] = None,
+    ttl_resolver: Optional[Callable[[Dict[str, Any]], Optional[int]]] = None,
+    tags_resolver: Optional[Callable[[Dict[str, Any]], List[str]]] = None,
 ) -> Callable[[Any], Any]:
+    """Кеширует результат эндпоинта в Redis.
+
+    TTL берётся из expiration_seconds, иначе из ttl_resolver по
+    нормализованным аргументам, иначе — до ежедневного сброса. Перед Redis
+    стоит local_cache: горячие ключи отдаются из памяти воркера. Ключ
+    помечается тегами (по умолчанию default_cache_tags), по которым
+    invalidate_tags сбрасывает только затронутые загрузкой ответы.
+
+    Промах пересчитывается один раз: одинаковые запросы внутри процесса ждут
+    уже идущий вызов, а между воркерами ключ защищён блокировкой в Redis —
+    остальные получают устаревшую копию или ждут свежую.
+
+    Ключ содержит поколение префикса, поэтому clear_cache("<prefix>:*")
+    сбрасывает все ответы эндпоинта одним HINCRBY. Обращения считаются
+    в популярности запросов, по которой warm_cache прогревает кеш.
+    """
+    _registered_prefixes.add(key_prefix)
+
     def _cache_response(func: Callable[..., Any]) -> Any:
         @functools.wraps(func)
         async def wrapper(*args, **kwargs) -> Any:
             try:
+                cache_args = normalize_cache_args(func, args, kwargs)
+            except Exception as e:
+                logger.error(f"Непредвиденная ошибка в декораторе cache_response: {e}")
+                return await func(*args, **kwargs)
+
+            if not _warming.get():
+                _popularity[_popularity_member(key_prefix, cache_args)] += 1
+
+            # Пока поколение известно, локальное попадание обходится без Redis
+            redis_conn = None
+            generation = _cached_generation(key_prefix)
+            if generation is None:
                 redis_conn = await get_redis_client()
-                
                 if redis_conn is None:
                     logger.warning(f"Redis недоступен, выполнение {func.__name__} без кэширования")
+                    CACHE_ERRORS.inc(prefix=key_prefix, operation="unavailable")
                     return await func(*args, **kwargs)
+                generation = await _current_generation(redis_conn, key_prefix)
+            cache_key = build_cache_key(key_prefix, func, cache_args, generation)
 
-                cache_args = {k: v for k, v in kwargs.items() if k != "db"}
-                cache_key = f"{key_prefix}:{func.__name__}:{json.dumps(cache_args, sort_keys=True, default=str)}"
+            local_value = local_cache.get(cache_key)
+            if local_value is not None:
+                CACHE_HITS.inc(prefix=key_prefix, tier="local")
+                return _materialize(local_value)
 
-                try:
-                    cached_data = await redis_conn.get(cache_key)
-                    if cached_data:
-                        logger.info(f"Данные получены из кеша для ключа: {cache_key}")
-                        return json.loads(cached_data)
-                except Exception as e:
-                    logger.error(f"Ошибка при получении данных из кеша: {e}")
-
-                response_data = await func(*args, **kwargs)
-
-                ttl = (
-                    expiration_seconds
-                    if expiration_seconds is not None
-                    else get_ttl_until_daily_reset()
-                )
+            if redis_conn is None:
+                redis_conn = await get_redis_client()
+                if redis_conn is None:
+                    logger.warning(f"Redis недоступен, выполнение {func.__name__} без кэширования")
+                    CACHE_ERRORS.inc(prefix=key_prefix, operation="unavailable")
+                    return await func(*args, **kwargs)
+
+            try:
+                cached_data = await redis_conn.get(cache_key)
+                redis_breaker.record_success()
+                if cached_data:
+                    logger.info(f"Данные получены из кеша для ключа: {cache_key}")
+                    value = _decode_cache_value(cached_data)
+                    local_cache.set(cache_key, value, LOCAL_CACHE_MAX_TTL, len(cached_data))
+                    CACHE_HITS.inc(prefix=key_prefix, tier="redis")
+                    return _materialize(value)
+            except Exception as e:
+                logger.error(f"Ошибка при получении данных из кеша: {e}")
+                if _redis_unavailable(e, "get", key_prefix):
+                    return await func(*args, **kwargs)
 
+            leader = _inflight.get(cache_key)
+            if leader is not None:
                 try:
-                    await redis_conn.setex(
-                        cache_key, ttl, json.dumps(response_data, default=str)
-                    )
-                    logger.info(
-                        f"Данные закешированы для ключа: {cache_key} с TTL: {ttl} секунд"
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка при сохранении данных в кеш: {e}")
-                
+                    cache_value = await asyncio.shield(leader)
+                except asyncio.CancelledError:
+                    if not leader.cancelled():
+                        raise
+                    cache_value = None
+                if cache_value is not None:
+                    CACHE_HITS.inc(prefix=key_prefix, tier="inflight")
+                    return _load_cache_value(cache_value)
+                # Потоковые ответы не делятся между запросами — считаем сами
+                return await func(*args, **kwargs)
+
+            def resolve_ttl() -> int:
+                ttl = expiration_seconds
+                if ttl is None and ttl_resolver is not None:
+                    ttl = ttl_resolver(cache_args)
+                if ttl is None:
+                    ttl = get_ttl_until_daily_reset()
+                return ttl
+
+            def resolve_tags() -> List[str]:
+                if tags_resolver is not None:
+                    return tags_resolver(cache_args)
+                return default_cache_tags(key_prefix, cache_args)
+
+            future = asyncio.get_running_loop().create_future()
+            _inflight[cache_key] = future
+            try:
+                response_data, cache_value = await _compute_with_lock(
+                    redis_conn, cache_key, lambda: func(*args, **kwargs), resolve_ttl, resolve_tags
+                )
+                future.set_result(cache_value)
                 return response_data
             except Exception as e:
-                logger.error(f"Непредвиденная ошибка в декораторе cache_response: {e}")
-                return await func(*args, **kwargs)
+                future.set_exception(e)
+                raise
+            finally:
+                _inflight.pop(cache_key, None)
+                if not future.done():
+                    future.cancel()
+                elif not future.cancelled():
+                    # Помечаем исключение полученным, даже если ожидающих не было
+                    future.exception()
 
+        _warm_targets[key_prefix] = wrapper
         return wrapper
 
     return _cache_response
 
 
+def _prefixes_for_pattern(pattern: str) -> Optional[Set[str]]:
+    """Префиксы, которые шаблон очищает целиком; None — шаблон уже префикса."""
+    if pattern == "*":
+        return _registered_prefixes | set(_generations)
+    if pattern.endswith(":*") and not any(char in pattern[:-2] for char in "*?[]:"):
+        return {pattern[:-2]}
+    return None
+
+
+async def _unlink_matching(
+    redis_conn: Redis, pattern: str, keep: Optional[Callable[[str], bool]] = None
+) -> int:
+    """Удаляет ключи по шаблону через SCAN + UNLINK небольшими пачками.
+
+    SCAN не блокирует Redis на время обхода, а UNLINK освобождает память
+    в фоновом потоке. Устаревшие копии (stale:*) не трогаются.
+    """
+    removed = 0
+    batch = []
+    async for raw_key in redis_conn.scan_iter(match=pattern, count=_SWEEP_BATCH_SIZE):
+        key = _text(raw_key)
+        if key.startswith(STALE_PREFIX) or (keep is not None and keep(key)):
+            continue
+        batch.append(key)
+        if len(batch) >= _SWEEP_BATCH_SIZE:
+            removed += await redis_conn.unlink(*batch)
+            batch = []
+    if batch:
+        removed += await redis_conn.unlink(*batch)
+    return removed
+
+
 async def clear_cache(pattern: str = "*") -> bool:
-    """Очищает кеш по заданному шаблону."""
+    """Очищает кеш по заданному шаблону в Redis и в памяти всех воркеров.
+
+    "*" и "<prefix>:*" сбрасываются за O(1) увеличением поколения префикса;
+    старые ключи удаляет sweep_stale_generations. Прочие шаблоны удаляются
+    через SCAN + UNLINK. Устаревшие копии (stale:*) не удаляются: они нужны,
+    чтобы после сброса отдавать прежний ответ, пока один воркер пересчитывает ключ.
+    """
+    local_cache.invalidate(pattern)
     try:
         redis_conn = await get_redis_client()
         if redis_conn is None:
             logger.error("Невозможно очистить кеш: Redis недоступен")
             return False
-            
-        keys = await redis_conn.keys(pattern)
-        if keys:
-            await redis_conn.delete(*keys)
-            logger.info(f"Очищено {len(keys)} ключей кеша по шаблону '{pattern}'")
+
+        prefixes = _prefixes_for_pattern(pattern)
+        if prefixes is not None:
+            for prefix in sorted(prefixes):
+                _generations[prefix] = await redis_conn.hincrby(GENERATIONS_KEY, prefix, 1)
+                logger.info(f"Кеш префикса '{prefix}' сброшен, поколение {_generations[prefix]}")
+            _sweep_requested.set()
         else:
-            logger.info(f"Ключи по шаблону '{pattern}' не найдены")
+            removed = await _unlink_matching(redis_conn, pattern)
+            logger.info(f"Очищено {removed} ключей кеша по шаблону '{pattern}'")
+        await redis_conn.publish(INVALIDATION_CHANNEL, pattern)
         return True
     except Exception as e:
+        _redis_unavailable(e, "clear")
         logger.error(f"Ошибка при очистке кеша: {e}")
         return False
 
 
-async def schedule_cache_reset():
-    """Планирует сброс кэша каждый день в 14:11."""
+async def sweep_stale_generations(interval: int = CACHE_SWEEP_INTERVAL):
+    """Удаляет в фоне ключи прошлых поколений через SCAN + UNLINK.
+
+    Просыпается по таймеру и сразу после сброса поколения в этом воркере.
+    """
+    while True:
+        try:
+            await asyncio.wait_for(_sweep_requested.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        _sweep_requested.clear()
+        try:
+            redis_conn = await get_redis_client()
+            if redis_conn is None:
+                continue
+            await _refresh_generations(redis_conn)
+            removed = 0
+            for prefix in sorted(_registered_prefixes | set(_generations)):
+                current = _generations.get(prefix, 0)
+                removed += await _unlink_matching(
+                    redis_conn,
+                    f"{prefix}:*",
+                    # Более новое поколение могло появиться в другом воркере после чтения счётчиков
+                    keep=lambda key, current=current: _key_generation(key) >= current,
+                )
+            if removed:
+                logger.info(f"Удалено {removed} ключей прошлых поколений кеша")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _redis_unavailable(e, "sweep")
+            logger.error(f"Ошибка очистки прошлых поколений кеша: {e}")
+
+
+async def invalidate_tags(tags: Iterable[str]) -> bool:
+    """Удаляет ключи кеша с указанными тегами в Redis и в памяти всех воркеров."""
+    tag_keys = [f"{TAG_PREFIX}{tag}" for tag in tags]
+    if not tag_keys:
+        return True
+    try:
+        redis_conn = await get_redis_client()
+        if redis_conn is None:
+            logger.error("Невозможно сбросить теги кеша: Redis недоступен")
+            return False
+
+        keys = [
+            _text(key)
+            for key in await redis_conn.eval(
+                _INVALIDATE_TAGS_SCRIPT,
+                len(tag_keys) + 1,
+                DATA_VERSION_KEY,
+                *tag_keys,
+                INVALIDATION_EPOCH_FIELD,
+            )
+        ]
+        if keys:
+            patterns = [glob.escape(key) for key in keys]
+            for pattern in patterns:
+                local_cache.invalidate(pattern)
+            await redis_conn.publish(INVALIDATION_CHANNEL, "\n".join(patterns))
+        logger.info(f"Сброшено {len(keys)} ключей кеша по {len(tag_keys)} тегам")
+        return True
+    except Exception as e:
+        _redis_unavailable(e, "tags")
+        logger.error(f"Ошибка при сбросе тегов кеша: {e}")
+        return False
+
+
+async def listen_for_invalidations(retry_delay: float = 5.0):
+    """Слушает канал сброса и очищает локальный кеш воркера.
+
+    Сообщение — один или несколько glob-шаблонов, по одному на строку.
+    """
+    while True:
+        try:
+            redis_conn = await get_redis_client()
+            if redis_conn is None:
+                await asyncio.sleep(retry_delay)
+                continue
+            async with redis_conn.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                logger.info(f"Подписка на канал сброса кеша {INVALIDATION_CHANNEL}")
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    patterns = _text(message["data"]).split("\n")
+                    # Сброс мог увеличить поколение и версию данных — перечитываем при следующем запросе
+                    _forget_generations()
+                    _forget_data_version()
+                    removed = sum(local_cache.invalidate(pattern) for pattern in patterns)
+                    logger.info(
+                        f"Локальный кеш: удалено {removed} записей по {len(patterns)} шаблонам"
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _redis_unavailable(e, "subscribe")
+            logger.error(f"Ошибка подписки на сброс кеша: {e}")
+            # Сообщения могли потеряться — надёжнее начать с пустого локального кеша
+            local_cache.clear()
+            _forget_generations()
+            _forget_data_version()
+            await asyncio.sleep(retry_delay)
+
+
+def _popularity_member(key_prefix: str, cache_args: Dict[str, Any]) -> str:
+    return f"{key_prefix}:{json.dumps(cache_args, sort_keys=True, default=str)}"
+
+
+async def flush_popularity() -> None:
+    """Сливает накопленные счётчики популярности в Redis и обрезает рейтинг."""
+    global _popularity
+    if not _popularity:
+        return
+    counts, _popularity = _popularity, Counter()
+    try:
+        redis_conn = await get_redis_client()
+        if redis_conn is None:
+            return
+        async with redis_conn.pipeline(transaction=False) as pipe:
+            for member, count in counts.items():
+                pipe.zincrby(POPULARITY_KEY, count, member)
+            pipe.zremrangebyrank(POPULARITY_KEY, 0, -CACHE_POPULARITY_SIZE - 1)
+            await pipe.execute()
+    except Exception as e:
+        _redis_unavailable(e, "popularity")
+        logger.error(f"Ошибка сохранения популярности запросов: {e}")
+
+
+async def flush_popularity_periodically(interval: float = CACHE_POPULARITY_FLUSH):
+    while True:
+        await asyncio.sleep(interval)
+        await flush_popularity()
+
+
+async def decay_popularity(factor: float = 0.5) -> None:
+    """Уменьшает накопленную популярность, чтобы старые запросы уступали новым."""
+    try:
+        redis_conn = await get_redis_client()
+        if redis_conn is not None:
+            await redis_conn.zunionstore(POPULARITY_KEY, {POPULARITY_KEY: factor})
+    except Exception as e:
+        _redis_unavailable(e, "popularity")
+        logger.error(f"Ошибка ослабления популярности запросов: {e}")
+
+
+def _call_arguments(func: Callable[..., Any], cache_args: Dict[str, Any]) -> Dict[str, Any]:
+    """Восстанавливает аргументы вызова эндпоинта из нормализованных аргументов ключа."""
+    arguments = {}
+    for name, parameter in inspect.signature(func).parameters.items():
+        if name in _EXCLUDED_ARGS:
+            continue
+        if name not in cache_args:
+            arguments[name] = _resolve_default(parameter)
+        elif parameter.annotation is inspect.Parameter.empty:
+            arguments[name] = cache_args[name]
+        else:
+            # Даты в ключе хранятся строками ISO — приводим к типам из сигнатуры
+            arguments[name] = TypeAdapter(parameter.annotation).validate_python(cache_args[name])
+    return arguments
+
+
+async def warm_cache(
+    session_factory: Callable[[], Any],
+    top_n: int = CACHE_WARM_TOP_N,
+    concurrency: int = CACHE_WARM_CONCURRENCY,
+) -> int:
+    """Заранее вычисляет top_n самых популярных запросов, не больше concurrency сразу.
+
+    Запросы проходят через обычный cache_response: уже закешированные
+    отдаются из кеша, остальные считаются под блокировкой ключа. Эндпоинты
+    с параметром db получают сессию из session_factory. Возвращает число
+    прогретых запросов.
+    """
+    await flush_popularity()
+    try:
+        redis_conn = await get_redis_client()
+        if redis_conn is None:
+            return 0
+        members = await redis_conn.zrevrange(POPULARITY_KEY, 0, top_n - 1)
+    except Exception as e:
+        _redis_unavailable(e, "warm")
+        logger.error(f"Ошибка чтения популярных запросов: {e}")
+        return 0
+
+    start_time = asyncio.get_running_loop().time()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm(member: str) -> bool:
+        key_prefix, _, raw_args = member.partition(":")
+        target = _warm_targets.get(key_prefix)
+        if target is None:
+            return False
+        async with semaphore:
+            token = _warming.set(True)
+            try:
+                arguments = _call_arguments(target, json.loads(raw_args))
+                if "db" in inspect.signature(target).parameters:
+                    async with session_factory() as db:
+                        await target(db=db, **arguments)
+                else:
+                    await target(**arguments)
+                return True
+            except Exception as e:
+                logger.warning(f"Не удалось прогреть запрос {member}: {e}")
+                return False
+            finally:
+                _warming.reset(token)
+
+    results = await asyncio.gather(*(warm(_text(member)) for member in members))
+    warmed = sum(results)
+    logger.info(
+        f"Прогрето {warmed} из {len(members)} популярных запросов за "
+        f"{asyncio.get_running_loop().time() - start_time:.2f} секунд"
+    )
+    return warmed
+
+
+async def _claim_daily_reset() -> bool:
+    """Ставит ключ сброса на сегодня; True — сброс выполняет этот воркер."""
+    try:
+        redis_conn = await get_redis_client()
+        if redis_conn is None:
+            return False
+        claimed = await redis_conn.set(
+            f"{RESET_LOCK_PREFIX}{date.today():%Y-%m-%d}", uuid.uuid4().hex, nx=True, ex=RESET_LOCK_TTL
+        )
+        return bool(claimed)
+    except Exception as e:
+        _redis_unavailable(e, "reset")
+        logger.error(f"Ошибка захвата ежедневного сброса кеша: {e}")
+        return False
+
+
+async def run_daily_reset(on_reset: Optional[Callable[[], Awaitable[Any]]] = None) -> None:
+    """Ежедневный сброс: очистка, ослабление популярности и прогрев.
+
+    Цикл сброса есть в каждом воркере, но работу делает только захвативший
+    ключ дня: иначе поколения увеличились бы N раз, популярность ослабла бы
+    в 0.5^N раз, а N прогревов перемежались бы со сбросами и теряли ключи.
+    Остальные воркеры сбрасывают только свой локальный уровень.
+    """
+    if not await _claim_daily_reset():
+        local_cache.clear()
+        _forget_generations()
+        logger.info("Ежедневный сброс кеша выполняет другой воркер, очищен только локальный кеш")
+        return
+
+    success = await clear_cache()
+    if success:
+        logger.info("Кэш успешно сброшен по расписанию в 14:11")
+        await decay_popularity()
+        if on_reset is not None:
+            try:
+                await on_reset()
+            except Exception as e:
+                logger.error(f"Ошибка прогрева кеша после сброса: {e}")
+    else:
+        logger.error("Не удалось сбросить кэш по расписанию")
+
+
+async def schedule_cache_reset(on_reset: Optional[Callable[[], Awaitable[Any]]] = None):
+    """Планирует сброс кэша каждый день в 14:11; после сброса вызывает on_reset (прогрев)."""
     while True:
         ttl = get_ttl_until_daily_reset()
         logger.info(f"Следующий сброс кэша запланирован через {ttl} секунд")
         
         await asyncio.sleep(ttl)
         
-        success = await clear_cache()
-        if success:
-            logger.info("Кэш успешно сброшен по расписанию в 14:11")
-        else:
-            logger.error("Не удалось сбросить кэш по расписанию")
+        await run_daily_reset(on_reset)
         
         # Чтобы избежать повторного срабатывания
         await asyncio.sleep(2)
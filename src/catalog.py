@@ -0,0 +1,97 @@
+import logging
+import time
+from datetime import date, datetime
+from typing import Dict, List, Literal, Optional
+
+from config import CATALOG_RETRY_INTERVAL
+from models import SpimexDailyRollup
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+Dimension = Literal["oil_id", "delivery_basis_id", "delivery_type_id"]
+
+CATALOG_DIMENSIONS = ("oil_id", "delivery_basis_id", "delivery_type_id")
+
+# Индекс измерений в памяти процесса: заменяется целиком при обновлении
+_catalog: Dict[str, List[dict]] = {dimension: [] for dimension in CATALOG_DIMENSIONS}
+_refreshed_at: Optional[datetime] = None
+_latest_trade_date: Optional[date] = None
+# Версия данных, по которой построен каталог, и время последней ошибки обновления
+_data_version: Optional[int] = None
+_failed_at: Optional[float] = None
+
+
+def catalog_refreshed_at() -> Optional[datetime]:
+    return _refreshed_at
+
+
+def catalog_data_version() -> Optional[int]:
+    """Версия данных (cache:data_version) на момент обновления каталога."""
+    return _data_version
+
+
+def record_refresh_failure() -> None:
+    global _failed_at
+    _failed_at = time.monotonic()
+
+
+def refresh_allowed() -> bool:
+    """После ошибки БД каталог перечитывается не чаще раза в CATALOG_RETRY_INTERVAL."""
+    return _failed_at is None or time.monotonic() - _failed_at >= CATALOG_RETRY_INTERVAL
+
+
+def latest_trade_date() -> Optional[date]:
+    """Последняя торговая дата в базе на момент обновления каталога."""
+    return _latest_trade_date
+
+
+async def refresh_catalog(session: AsyncSession, data_version: Optional[int] = None) -> None:
+    """Перестраивает индекс измерений по таблице дневных итогов."""
+    global _catalog, _refreshed_at, _latest_trade_date, _data_version, _failed_at
+    start_time = time.time()
+    catalog = {}
+    for dimension in CATALOG_DIMENSIONS:
+        column = getattr(SpimexDailyRollup, dimension)
+        query = (
+            select(
+                column,
+                func.min(SpimexDailyRollup.date),
+                func.max(SpimexDailyRollup.date),
+                func.sum(SpimexDailyRollup.rows),
+            )
+            .group_by(column)
+            .order_by(column)
+        )
+        result = await session.execute(query)
+        catalog[dimension] = [
+            {
+                "value": value,
+                "first_trade_date": first_date.isoformat(),
+                "last_trade_date": last_date.isoformat(),
+                "rows": int(rows),
+            }
+            for value, first_date, last_date, rows in result.all()
+        ]
+    _catalog = catalog
+    _refreshed_at = datetime.now()
+    _data_version = data_version
+    _failed_at = None
+    _latest_trade_date = max(
+        (date.fromisoformat(item["last_trade_date"]) for item in catalog["oil_id"]),
+        default=None,
+    )
+    logger.info(
+        f"Каталог измерений обновлён: "
+        f"{', '.join(f'{d}={len(v)}' for d, v in catalog.items())} за {time.time() - start_time:.2f} секунд"
+    )
+
+
+def get_catalog(dimension: Dimension, prefix: Optional[str] = None) -> List[dict]:
+    """Значения измерения из памяти, с фильтром по префиксу для автодополнения."""
+    values = _catalog[dimension]
+    if prefix:
+        prefix = prefix.upper()
+        values = [item for item in values if item["value"].upper().startswith(prefix)]
+    return values
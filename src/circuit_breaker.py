@@ -0,0 +1,53 @@
+import time
+
+
+class CircuitBreaker:
+    """Предохранитель для внешней зависимости: closed → open → half_open.
+
+    После failure_threshold ошибок подряд цепь размыкается, и вызовы сразу
+    получают отказ без попыток соединения. Когда пауза истекает, пропускается
+    одна пробная попытка (half_open): успех замыкает цепь, неудача снова
+    размыкает её с удвоенной паузой, но не дольше max_reset_timeout.
+    Не потокобезопасен — рассчитан на один event loop воркера.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, max_reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._current_timeout = reset_timeout
+        self._opened_at = 0.0
+
+    def allow_request(self) -> bool:
+        """Можно ли обращаться к зависимости; при истёкшей паузе переходит в half_open."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self._current_timeout:
+            self.state = self.HALF_OPEN
+            return True
+        # Разомкнута или пробная попытка уже идёт
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._current_timeout = self.reset_timeout
+
+    def record_failure(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._current_timeout = min(self._current_timeout * 2, self.max_reset_timeout)
+            self._open()
+            return
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
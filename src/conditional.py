@@ -0,0 +1,92 @@
+import hashlib
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, List, Optional, Tuple
+
+from cache import current_data_version, get_ttl_until_daily_reset
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def make_etag(version: int, path: str, query_string: bytes) -> str:
+    """Слабый ETag: версия данных и хеш URL запроса.
+
+    Пока загрузка не увеличила версию, ответ на тот же URL не меняется.
+    Слабый, потому что тело из кеша может прийти сжатым или несжатым.
+    """
+    digest = hashlib.blake2b(path.encode() + b"?" + query_string, digest_size=8).hexdigest()
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Слабое сравнение ETag из If-None-Match (RFC 9110, 13.1.2)."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified_since(if_modified_since: str, updated_at: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return since.tzinfo is not None and updated_at <= since
+
+
+class ConditionalGetMiddleware:
+    """ETag, Last-Modified и Cache-Control для GET-эндпоинтов чтения.
+
+    Валидаторы строятся из версии данных, без обращения к БД и к
+    закешированным ответам. Поэтому совпавший If-None-Match (или
+    If-Modified-Since без него) получает 304 до вызова эндпоинта. max-age
+    доживает до ежедневного сброса кеша. Пока версия неизвестна (Redis
+    недоступен), запросы проходят без изменений.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str]):
+        self.app = app
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        data_version = await current_data_version()
+        if data_version is None:
+            await self.app(scope, receive, send)
+            return
+
+        etag = make_etag(data_version.version, scope["path"], scope["query_string"])
+        validators: List[Tuple[str, str]] = [
+            ("etag", etag),
+            ("cache-control", f"public, max-age={get_ttl_until_daily_reset()}"),
+        ]
+        if data_version.updated_at is not None:
+            validators.append(("last-modified", format_datetime(data_version.updated_at, usegmt=True)))
+
+        if self._not_modified(Headers(scope=scope), etag, data_version.updated_at):
+            await Response(status_code=304, headers=dict(validators))(scope, receive, send)
+            return
+
+        raw_validators = [(name.encode(), value.encode("latin-1")) for name, value in validators]
+
+        async def send_with_validators(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message["headers"] = list(message.get("headers", [])) + raw_validators
+            await send(message)
+
+        await self.app(scope, receive, send_with_validators)
+
+    @staticmethod
+    def _not_modified(headers: Headers, etag: str, updated_at: Optional[datetime]) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            # If-None-Match важнее If-Modified-Since (RFC 9110, 13.2.2)
+            return etag_matches(if_none_match, etag)
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since is not None and updated_at is not None:
+            return not_modified_since(if_modified_since, updated_at)
+        return False
@@ -10,10 +10,76 @@ DB_PORT = os.environ.get("DB_PORT")
 DB_USER = os.environ.get("DB_USER")
 DB_PASS = os.environ.get("DB_PASS")
 
+# Реплика только для чтения: если не задана, чтение идёт с основной базы
+DB_REPLICA_HOST = os.environ.get("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.environ.get("DB_REPLICA_PORT", DB_PORT)
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() in ("1", "true", "yes")
+
 REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
 REDIS_PORT = os.environ.get("REDIS_PORT", "6379")
 REDIS_DB = os.environ.get("REDIS_DB", "0")
 
+# Пул соединений Redis: кеш не должен ждать дольше, чем ответила бы база
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get("REDIS_CONNECT_TIMEOUT", "1"))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", "2"))
+# Сколько ждать свободного соединения из пула, прежде чем обойти кеш
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", "1"))
+
+# Предохранитель Redis: после скольких ошибок подряд и на сколько секунд отключать кеш
+REDIS_BREAKER_FAILURES = int(os.environ.get("REDIS_BREAKER_FAILURES", "3"))
+REDIS_BREAKER_RESET = float(os.environ.get("REDIS_BREAKER_RESET", "1"))
+REDIS_BREAKER_MAX_RESET = float(os.environ.get("REDIS_BREAKER_MAX_RESET", "60"))
+
+# TTL для ответов по закрытым историческим диапазонам дат (по умолчанию неделя)
+HISTORICAL_CACHE_TTL = int(os.environ.get("HISTORICAL_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Локальный кеш воркера перед Redis
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get("LOCAL_CACHE_MAX_ENTRIES", "1024"))
+LOCAL_CACHE_MAX_BYTES = int(os.environ.get("LOCAL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LOCAL_CACHE_MAX_TTL = int(os.environ.get("LOCAL_CACHE_MAX_TTL", "300"))
+
+# Защита от лавины промахов: блокировка пересчёта ключа и устаревшие копии
+CACHE_LOCK_TTL = float(os.environ.get("CACHE_LOCK_TTL", "10"))
+CACHE_LOCK_WAIT = float(os.environ.get("CACHE_LOCK_WAIT", "5"))
+CACHE_STALE_TTL = int(os.environ.get("CACHE_STALE_TTL", "3600"))
+
+# Тела ответов крупнее порога хранятся в Redis сжатыми gzip
+CACHE_COMPRESS_MIN_BYTES = int(os.environ.get("CACHE_COMPRESS_MIN_BYTES", "1024"))
+CACHE_COMPRESS_LEVEL = int(os.environ.get("CACHE_COMPRESS_LEVEL", "6"))
+
+# Прогрев кеша: сколько популярных запросов пересчитывать и сколько одновременно
+CACHE_WARM_TOP_N = int(os.environ.get("CACHE_WARM_TOP_N", "50"))
+CACHE_WARM_CONCURRENCY = int(os.environ.get("CACHE_WARM_CONCURRENCY", "4"))
+CACHE_POPULARITY_SIZE = int(os.environ.get("CACHE_POPULARITY_SIZE", "1000"))
+CACHE_POPULARITY_FLUSH = float(os.environ.get("CACHE_POPULARITY_FLUSH", "10"))
+
+# Поколения ключей: как часто перечитывать счётчики и чистить старые поколения
+CACHE_GENERATION_REFRESH = float(os.environ.get("CACHE_GENERATION_REFRESH", "5"))
+CACHE_SWEEP_INTERVAL = int(os.environ.get("CACHE_SWEEP_INTERVAL", "600"))
+
+# Каталог измерений: пауза перед повторной загрузкой из БД после ошибки, секунды
+CATALOG_RETRY_INTERVAL = float(os.environ.get("CATALOG_RETRY_INTERVAL", "30"))
+
+# HTTP-клиент загрузки бюллетеней: одна сессия и пул соединений на весь запуск
+SPIMEX_HTTP_LIMIT = int(os.environ.get("SPIMEX_HTTP_LIMIT", "20"))
+SPIMEX_HTTP_LIMIT_PER_HOST = int(os.environ.get("SPIMEX_HTTP_LIMIT_PER_HOST", "10"))
+SPIMEX_HTTP_KEEPALIVE = float(os.environ.get("SPIMEX_HTTP_KEEPALIVE", "30"))
+SPIMEX_HTTP_DNS_TTL = int(os.environ.get("SPIMEX_HTTP_DNS_TTL", "300"))
+SPIMEX_HTTP_TIMEOUT = float(os.environ.get("SPIMEX_HTTP_TIMEOUT", "30"))
+
+# Разбор бюллетеней в пуле процессов; 0 — в отдельном потоке без пула процессов
+SPIMEX_PARSE_WORKERS = int(os.environ.get("SPIMEX_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+# Конвейер загрузки: ёмкость очередей между этапами и размер батча вставки
+SPIMEX_PIPELINE_QUEUE_SIZE = int(os.environ.get("SPIMEX_PIPELINE_QUEUE_SIZE", "8"))
+SPIMEX_INSERT_BATCH_SIZE = int(os.environ.get("SPIMEX_INSERT_BATCH_SIZE", "1000"))
+
 # Отладочный вывод
 if __name__ == "__main__":
     print(f"DB_NAME: {DB_NAME}")
@@ -21,6 +87,8 @@ if __name__ == "__main__":
     print(f"DB_PORT: {DB_PORT}")
     print(f"DB_USER: {DB_USER}")
     print(f"DB_PASS: {'[HIDDEN]' if DB_PASS else None}")
+    print(f"DB_REPLICA_HOST: {DB_REPLICA_HOST}")
+    print(f"DB_POOL_SIZE: {DB_POOL_SIZE}, DB_MAX_OVERFLOW: {DB_MAX_OVERFLOW}")
     print(f"REDIS_HOST: {REDIS_HOST}")
     print(f"REDIS_PORT: {REDIS_PORT}")
     print(f"REDIS_DB: {REDIS_DB}")
@@ -1,7 +1,23 @@
 import logging
+import time
 
-from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
-from sqlalchemy import create_engine
+from config import (
+    DB_ECHO,
+    DB_HOST,
+    DB_MAX_OVERFLOW,
+    DB_NAME,
+    DB_PASS,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_PORT,
+    DB_REPLICA_HOST,
+    DB_REPLICA_PORT,
+    DB_USER,
+)
+from metrics import Histogram
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from typing import AsyncGenerator
@@ -20,15 +36,69 @@ SYNC_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_N
 ASYNC_DATABASE_URL = (
     f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
+ASYNC_REPLICA_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+    if DB_REPLICA_HOST
+    else None
+)
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_timeout": DB_POOL_TIMEOUT,
+}
 
 Base = declarative_base()
 
+DB_QUERY_LATENCY = Histogram(
+    "spimex_db_query_duration_seconds",
+    "Время выполнения SQL-запросов по движку и виду запроса",
+    ("engine", "statement"),
+)
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Замеряет время каждого запроса движка через события курсора.
+
+    Для асинхронных движков передаётся engine.sync_engine: события
+    срабатывают вокруг await драйвера, так что asyncpg тоже учитывается.
+    """
+
+    # Начало хранится в контексте выполнения, а не в conn.info: если запрос
+    # упал, after_cursor_execute не вызывается, и отметка уходит вместе с контекстом
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._spimex_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _observe(conn, cursor, statement, parameters, context, executemany):
+        started = context._spimex_query_start
+        DB_QUERY_LATENCY.observe(
+            time.perf_counter() - started,
+            engine=name,
+            statement=statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "",
+        )
+
+
 try:
     # Синхронный движок для создания таблиц и синхронных операций
     sync_engine = create_engine(SYNC_DATABASE_URL, pool_pre_ping=True)
 
-    # Асинхронный движок для асинхронных операций
-    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=True)
+    # Асинхронный движок для асинхронных операций (все записи идут сюда)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=DB_ECHO, **POOL_OPTIONS)
+
+    # Движок чтения: реплика, если задана, иначе тот же основной движок
+    read_async_engine = (
+        create_async_engine(ASYNC_REPLICA_DATABASE_URL, echo=DB_ECHO, **POOL_OPTIONS)
+        if ASYNC_REPLICA_DATABASE_URL
+        else async_engine
+    )
+
+    instrument_engine(sync_engine, "sync")
+    instrument_engine(async_engine.sync_engine, "primary")
+    if read_async_engine is not async_engine:
+        instrument_engine(read_async_engine.sync_engine, "replica")
 
     # Синхронная сессия
     SyncSession = sessionmaker(bind=sync_engine)
@@ -38,6 +108,11 @@ try:
         async_engine, class_=AsyncSession, expire_on_commit=False
     )
 
+    # Асинхронная сессия только для чтения
+    ReadSessionLocal = async_sessionmaker(
+        read_async_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
 except Exception as e:
     logger.error(f"Ошибка подключения к базе данных: {e}")
     raise
@@ -54,3 +129,12 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             raise
         finally:
             await session.close()
+
+
+# Зависимость для GET-эндпоинтов: чтение с реплики без фиксации транзакции
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -0,0 +1,41 @@
+from operator import attrgetter
+from typing import Callable, Optional, Sequence
+
+import orjson
+from fastapi import Response
+from pagination import NEXT_CURSOR_HEADER
+from trading_result_schema import TradingResultModel
+
+RowEncoder = Callable[[Sequence], bytes]
+
+
+def orm_row_encoder(columns: Sequence[str]) -> RowEncoder:
+    """Собирает кодировщик ORM-объектов в JSON-массив байт.
+
+    Геттер атрибутов строится один раз, поэтому на строку приходится один
+    вызов attrgetter и сборка dict, без валидации Pydantic. Ключи идут в
+    порядке columns, даты и время — в ISO 8601, как у ответа FastAPI.
+    """
+    columns = tuple(columns)
+    getter = attrgetter(*columns)
+    if len(columns) == 1:
+        return lambda rows: orjson.dumps([{columns[0]: getter(row)} for row in rows])
+    return lambda rows: orjson.dumps([dict(zip(columns, getter(row))) for row in rows])
+
+
+def core_row_encoder(columns: Sequence[str]) -> RowEncoder:
+    """Кодировщик строк Core: значения берутся по позиции в select()."""
+    columns = tuple(columns)
+    return lambda rows: orjson.dumps([dict(zip(columns, row)) for row in rows])
+
+
+# Схема ответа списочных эндпоинтов — поля TradingResultModel в их порядке
+encode_trading_results = orm_row_encoder(TradingResultModel.model_fields)
+
+
+def json_bytes_response(body: bytes, next_cursor: Optional[str] = None) -> Response:
+    """Готовое тело JSON без повторной валидации и сериализации FastAPI."""
+    response = Response(content=body, media_type="application/json")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
@@ -0,0 +1,83 @@
+import fnmatch
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires_at: float
+    size: int
+
+
+class LocalTTLCache:
+    """Ограниченный LRU-кеш в памяти процесса с TTL для каждой записи.
+
+    Ограничен и числом записей, и суммарным размером значений в байтах:
+    при переполнении вытесняются самые давно использованные записи.
+    Не потокобезопасен — рассчитан на один event loop воркера.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, max_ttl: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: str, value: Any, ttl: int, size: int) -> None:
+        """Сохраняет значение; TTL ограничивается max_ttl, крупные значения не кешируются."""
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(value, time.monotonic() + min(ttl, self.max_ttl), size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, pattern: str = "*") -> int:
+        """Удаляет записи, чьи ключи подходят под glob-шаблон (как KEYS в Redis)."""
+        if pattern == "*":
+            removed = len(self._entries)
+            self.clear()
+            return removed
+        matched = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+        for key in matched:
+            self._remove(key)
+        return len(matched)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
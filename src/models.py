@@ -1,15 +1,35 @@
 from datetime import datetime
 
-from sqlalchemy import Date, DateTime, Float, Integer, String
+from sqlalchemy import Date, DateTime, Float, Index, Integer, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from database import Base
 
+# Естественный ключ строки бюллетеня: один инструмент в один торговый день
+NATURAL_KEY = ("date", "exchange_product_id")
+
 
 class SpimexTradingResult(Base):
     __tablename__ = "spimex_trading_results"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        UniqueConstraint(*NATURAL_KEY, name="uq_spimex_trading_results_date_product"),
+        Index("ix_spimex_trading_results_date_id", "date", "id"),
+        Index("ix_spimex_trading_results_oil_id_date", "oil_id", "date"),
+        Index(
+            "ix_spimex_trading_results_delivery_type_id_date",
+            "delivery_type_id",
+            "date",
+        ),
+        Index(
+            "ix_spimex_trading_results_delivery_basis_id_date",
+            "delivery_basis_id",
+            "date",
+        ),
+        # Помесячные секции создаются при загрузке, см. repository.build_partition_statements
+        {"extend_existing": True, "postgresql_partition_by": "RANGE (date)"},
+    )
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # В секционированной таблице первичный ключ обязан включать ключ секционирования
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     exchange_product_id: Mapped[str] = mapped_column(String, nullable=False)
     exchange_product_name: Mapped[str] = mapped_column(String, nullable=False)
     oil_id: Mapped[str] = mapped_column(String, nullable=False)
@@ -19,6 +39,23 @@ class SpimexTradingResult(Base):
     volume: Mapped[float] = mapped_column(Float, nullable=False)
     total: Mapped[float] = mapped_column(Float, nullable=False)
     count: Mapped[int] = mapped_column(Integer, nullable=False)
-    date: Mapped[datetime.date] = mapped_column(Date, nullable=False)
+    date: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
     created_on: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     updated_on: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class SpimexDailyRollup(Base):
+    """Дневные итоги торгов по измерениям, пересчитываются загрузкой бюллетеней."""
+
+    __tablename__ = "spimex_daily_rollup"
+    __table_args__ = {"extend_existing": True}
+
+    date: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    oil_id: Mapped[str] = mapped_column(String, primary_key=True)
+    delivery_basis_id: Mapped[str] = mapped_column(String, primary_key=True)
+    delivery_type_id: Mapped[str] = mapped_column(String, primary_key=True)
+    volume: Mapped[float] = mapped_column(Float, nullable=False)
+    total: Mapped[float] = mapped_column(Float, nullable=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    rows: Mapped[int] = mapped_column(Integer, nullable=False)
+    updated_on: Mapped[datetime] = mapped_column(DateTime, nullable=False)
@@ -0,0 +1,61 @@
+import base64
+import json
+from datetime import date
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from models import SpimexTradingResult
+from sqlalchemy import Select, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(trade_date: date, row_id: int) -> str:
+    """Кодирует позицию (date, id) в непрозрачный токен."""
+    payload = json.dumps({"d": trade_date.isoformat(), "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    """Декодирует токен курсора, при ошибке отвечает 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return date.fromisoformat(payload["d"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Некорректный курсор: {e}")
+
+
+def apply_keyset(
+    query: Select,
+    cursor: Optional[str],
+    limit: Optional[int],
+    descending: bool = False,
+) -> Select:
+    """Добавляет к запросу сортировку по (date, id), условие курсора и limit + 1.
+
+    Лишняя строка нужна только чтобы узнать, есть ли следующая страница,
+    поэтому глубокие страницы стоят столько же, сколько первая, без OFFSET.
+    """
+    key = tuple_(SpimexTradingResult.date, SpimexTradingResult.id)
+    if descending:
+        query = query.order_by(SpimexTradingResult.date.desc(), SpimexTradingResult.id.desc())
+    else:
+        query = query.order_by(SpimexTradingResult.date, SpimexTradingResult.id)
+
+    if cursor:
+        position = tuple_(*decode_cursor(cursor))
+        query = query.filter(key < position if descending else key > position)
+
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+
+def split_page(rows: Sequence, limit: Optional[int]) -> Tuple[Sequence, Optional[str]]:
+    """Отрезает лишнюю строку и возвращает курсор следующей страницы."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(last.date, last.id)
@@ -0,0 +1,48 @@
+from typing import List, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from fast_json import core_row_encoder, json_bytes_response
+from models import SpimexTradingResult
+from sqlalchemy import Select, select
+from trading_result_schema import TradingResultModel
+
+PROJECTABLE_FIELDS = list(TradingResultModel.model_fields)
+
+# Колонки курсора выбираются всегда, даже если клиент их не запросил
+_KEYSET_COLUMNS = ("date", "id")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Разбирает параметр fields=date,oil_id,total в список колонок."""
+    if not fields:
+        return None
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in PROJECTABLE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(PROJECTABLE_FIELDS)}",
+        )
+    return requested or None
+
+
+def projection_query(fields: Sequence[str]) -> Select:
+    """Core select() только по запрошенным колонкам, без гидрации ORM.
+
+    Запрошенные колонки идут первыми, поэтому кодировщик берёт значения
+    строки по позиции, а хвост с ключом курсора отбрасывается.
+    """
+    table = SpimexTradingResult.__table__
+    selected = dict.fromkeys([*fields, *_KEYSET_COLUMNS])
+    return select(*(table.c[name] for name in selected))
+
+
+def encode_json_rows(rows: Sequence, fields: Sequence[str]) -> bytes:
+    """Сериализует строки Core в JSON-массив, минуя Pydantic."""
+    return core_row_encoder(fields)(rows)
+
+
+def projection_response(
+    rows: Sequence, fields: Sequence[str], next_cursor: Optional[str] = None
+) -> Response:
+    return json_bytes_response(encode_json_rows(rows, fields), next_cursor)
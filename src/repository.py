@@ -0,0 +1,114 @@
+import logging
+from datetime import date, timedelta
+from typing import Iterable, List
+
+from models import NATURAL_KEY, SpimexDailyRollup, SpimexTradingResult
+from sqlalchemy import TextClause, delete, func, select, text
+from sqlalchemy.dialects.postgresql import Insert, insert
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = SpimexTradingResult.__tablename__
+
+# Колонки, которые не перезаписываются при повторной загрузке бюллетеня
+_IMMUTABLE_COLUMNS = {"id", "created_on", *NATURAL_KEY}
+
+
+def dedupe_by_natural_key(records: List[dict]) -> List[dict]:
+    """Оставляет последнюю запись для каждого (date, exchange_product_id).
+
+    Postgres не позволяет одному INSERT ... ON CONFLICT DO UPDATE
+    затронуть одну и ту же строку дважды, поэтому дубликаты внутри
+    батча нужно схлопнуть до вставки.
+    """
+    unique = {}
+    for record in records:
+        unique[tuple(record[column] for column in NATURAL_KEY)] = record
+    if len(unique) != len(records):
+        logger.debug(f"Схлопнуто {len(records) - len(unique)} дубликатов в батче")
+    return list(unique.values())
+
+
+def build_upsert_statement(batch: List[dict]) -> Insert:
+    """Строит идемпотентный upsert батча по естественному ключу."""
+    stmt = insert(SpimexTradingResult).values(dedupe_by_natural_key(batch))
+    update_columns = {
+        column.name: stmt.excluded[column.name]
+        for column in SpimexTradingResult.__table__.columns
+        if column.name not in _IMMUTABLE_COLUMNS
+    }
+    return stmt.on_conflict_do_update(index_elements=list(NATURAL_KEY), set_=update_columns)
+
+
+def collect_trade_dates(records: Iterable[dict]) -> List[date]:
+    """Уникальные торговые даты загруженных записей."""
+    return sorted({record["date"] for record in records})
+
+
+def partition_name(month_start: date) -> str:
+    return f"{PARTITIONED_TABLE}_p{month_start:%Y%m}"
+
+
+def build_partition_statements(trade_dates: Iterable[date]) -> List[TextClause]:
+    """DDL помесячных секций, покрывающих переданные торговые даты.
+
+    CREATE TABLE IF NOT EXISTS дешёв для уже существующих секций, но новая
+    секция берёт ACCESS EXCLUSIVE на родительскую таблицу: выполнять в
+    отдельной транзакции до вставки (ensure_partitions загрузчиков). Старые
+    месяцы отключаются через ALTER TABLE ... DETACH PARTITION без
+    перезаписи данных.
+    """
+    statements = []
+    for month_start in sorted({d.replace(day=1) for d in trade_dates}):
+        next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        statements.append(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month_start)} "
+                f"PARTITION OF {PARTITIONED_TABLE} "
+                f"FOR VALUES FROM ('{month_start.isoformat()}') TO ('{next_month.isoformat()}')"
+            )
+        )
+    return statements
+
+
+def build_rollup_refresh_statements(trade_dates: List[date]) -> List:
+    """Пересчитывает дневные итоги только за переданные торговые даты.
+
+    Строки за дату сначала удаляются, затем вставляются заново из сырых
+    данных: так из итогов уходят и комбинации, которых больше нет в бюллетене.
+    Оба запроса нужно выполнять в одной транзакции.
+    """
+    dimensions = (
+        SpimexTradingResult.date,
+        SpimexTradingResult.oil_id,
+        SpimexTradingResult.delivery_basis_id,
+        SpimexTradingResult.delivery_type_id,
+    )
+    aggregate = (
+        select(
+            *dimensions,
+            func.sum(SpimexTradingResult.volume),
+            func.sum(SpimexTradingResult.total),
+            func.sum(SpimexTradingResult.count),
+            func.count(),
+            func.now(),
+        )
+        .where(SpimexTradingResult.date.in_(trade_dates))
+        .group_by(*dimensions)
+    )
+    delete_stmt = delete(SpimexDailyRollup).where(SpimexDailyRollup.date.in_(trade_dates))
+    insert_stmt = insert(SpimexDailyRollup).from_select(
+        [
+            "date",
+            "oil_id",
+            "delivery_basis_id",
+            "delivery_type_id",
+            "volume",
+            "total",
+            "count",
+            "rows",
+            "updated_on",
+        ],
+        aggregate,
+    )
+    return [delete_stmt, insert_stmt]
@@ -1,20 +1,51 @@
 import asyncio
 import logging
+import multiprocessing
 import os
 import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import date, datetime
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, Iterable, List, Optional, Set, Tuple
 import aiohttp
-import pandas as pd
 from bs4 import BeautifulSoup
+from bulletin_parser import parse_bulletin
+from cache import bump_data_version, ingestion_tags, invalidate_tags
+from config import (
+    SPIMEX_HTTP_DNS_TTL,
+    SPIMEX_HTTP_KEEPALIVE,
+    SPIMEX_HTTP_LIMIT,
+    SPIMEX_HTTP_LIMIT_PER_HOST,
+    SPIMEX_HTTP_TIMEOUT,
+    SPIMEX_INSERT_BATCH_SIZE,
+    SPIMEX_PARSE_WORKERS,
+    SPIMEX_PIPELINE_QUEUE_SIZE,
+)
 from database import async_engine
-from models import SpimexTradingResult
-from sqlalchemy.dialects.postgresql import insert
+from metrics import STAGE_BUCKETS, Histogram
+from repository import (
+    build_partition_statements,
+    build_rollup_refresh_statements,
+    build_upsert_statement,
+    collect_trade_dates,
+)
 from sqlalchemy.ext.asyncio import async_sessionmaker
-from trading_result_schema import TradingResultModel
 
 logger = logging.getLogger(__name__)
 
+BASE_URL = "https://spimex.com/markets/oil_products/trades/results/"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+}
+
+INGESTION_STAGE_LATENCY = Histogram(
+    "spimex_ingestion_stage_duration_seconds",
+    "Длительность этапов загрузки бюллетеней",
+    ("stage",),
+    buckets=STAGE_BUCKETS,
+)
+
 
 def parse_page_links(
     soup: BeautifulSoup, start_date: date, end_date: date, base_url: str
@@ -55,194 +86,86 @@ def parse_page_links(
     return bulletin_urls
 
 
-def parse_bulletin(file_path: str, trade_date: date) -> List[dict]:
-    start_time = time.time()
-    try:
-        # Проверка только расширения файла
-        if not file_path.lower().endswith(".xls"):
-            logger.error(f"Файл {file_path} не имеет расширение .xls")
-            return []
+def create_http_session() -> aiohttp.ClientSession:
+    """HTTP-сессия на один запуск загрузки.
 
-        # Чтение файла через pandas
-        try:
-            df = pd.read_excel(file_path, sheet_name=0, header=None)
-        except Exception as e:
-            logger.error(f"Не удалось открыть файл {file_path} как Excel: {e}")
-            return []
-
-        if len(df) <= 6:
-            logger.error(f"Файл {file_path} слишком короткий, нет строки с заголовками")
-            return []
-
-        headers = df.iloc[6].fillna("").tolist()
-        headers_clean = [h.replace("\n", " ").strip() for h in headers[1:]]
-
-        required_columns = {
-            "Код Инструмента": "exchange_product_id",
-            "Наименование Инструмента": "exchange_product_name",
-            "Базис поставки": "delivery_basis_name",
-            "Объем Договоров в единицах измерения": "volume",
-            "Обьем Договоров, руб.": "total",
-            "Количество Договоров, шт.": "count",
-        }
-
-        missing_cols = [col for col in required_columns if col not in headers_clean]
-        if missing_cols:
-            logger.error(f"Отсутствуют столбцы в {file_path}: {missing_cols}")
-            return []
-
-        data_rows = []
-        for i in range(8, len(df)):
-            row = df.iloc[i].tolist()
-            if (
-                pd.isna(row[1])
-                or row[1] == ""
-                or row[1] == "Код Инструмента"
-                or row[1].startswith("Код")
-            ):
-                logger.debug(
-                    f"Пропущена строка {i + 1}: содержит пустое значение или заголовок"
-                )
-                break
-            data_rows.append(row[1:])
-
-        if not data_rows:
-            logger.warning(f"Нет данных в {file_path} после строки с заголовками")
-            return []
-
-        data_df = pd.DataFrame(data_rows, columns=headers_clean)
-
-        for col in [
-            "Объем Договоров в единицах измерения",
-            "Обьем Договоров, руб.",
-            "Количество Договоров, шт.",
-        ]:
-            data_df[col] = data_df[col].replace("-", pd.NA)
-            data_df[col] = pd.to_numeric(data_df[col], errors="coerce").fillna(0)
-
-        logger.debug(f"До фильтрации: {len(data_df)} строк")
-        data_df = data_df[data_df["Количество Договоров, шт."] > 0]
-        logger.debug(
-            f"После фильтрации 'Количество Договоров, шт.' > 0: {len(data_df)} строк"
-        )
-        data_df = data_df[
-            ~data_df["Код Инструмента"].str.contains("Итог", case=False, na=False)
-        ]
-        logger.debug(f"После фильтрации 'Итог': {len(data_df)} строк")
-
-        # Переименовываем колонки в соответствии с моделью
-        data_df = data_df.rename(columns=required_columns)
-
-        current_time = pd.to_datetime(datetime.now())
-        data_df["date"] = trade_date
-        data_df["created_on"] = current_time
-        data_df["updated_on"] = current_time
-
-        # ГАРАНТИЯ: oil_id всегда строка и не null
-        if "oil_id" not in data_df.columns:
-            data_df["oil_id"] = "UNKNOWN"
-        data_df["oil_id"] = (
-            data_df["oil_id"].astype(str).replace(["nan", "None", "NaT", ""], "UNKNOWN")
-        )
-        data_df["oil_id"] = data_df["oil_id"].fillna("UNKNOWN")
-        assert not data_df["oil_id"].isnull().any(), "oil_id содержит NaN!"
-
-        # Извлекаем id, delivery_basis_id и delivery_type_id из exchange_product_id
-        data_df["id"] = range(1, len(data_df) + 1)
-        data_df["delivery_basis_id"] = data_df["exchange_product_id"].apply(
-            lambda x: (
-                x.split("-")[1]
-                if isinstance(x, str) and len(x.split("-")) > 1
-                else "UNKNOWN"
-            )
-        )
-        data_df["delivery_type_id"] = data_df["exchange_product_id"].apply(
-            lambda x: (
-                x.split("-")[2]
-                if isinstance(x, str) and len(x.split("-")) > 2
-                else "UNKNOWN"
-            )
-        )
-
-        from pydantic import TypeAdapter
-
-        adapter = TypeAdapter(List[TradingResultModel])
-        records = adapter.validate_python(data_df.to_dict(orient="records"))
-
-        result = [record.dict(by_alias=False) for record in records]
-        logger.info(
-            f"Спарсено {len(result)} записей из {file_path} за {time.time() - start_time:.2f} секунд"
-        )
-        return result
-    except Exception as e:
-        logger.error(f"Ошибка при парсинге {file_path}: {e}")
-        return []
+    Страницы и бюллетени берутся с одного хоста, поэтому общий пул
+    соединений с keep-alive и кешем DNS обходится несколькими
+    TCP+TLS-рукопожатиями на весь прогон вместо одного на каждый запрос.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=SPIMEX_HTTP_LIMIT,
+        limit_per_host=SPIMEX_HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=SPIMEX_HTTP_KEEPALIVE,
+        ttl_dns_cache=SPIMEX_HTTP_DNS_TTL,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=HEADERS,
+        timeout=aiohttp.ClientTimeout(total=SPIMEX_HTTP_TIMEOUT),
+    )
 
 
-async def get_max_pages(base_url: str, headers: dict) -> int:
+async def get_max_pages(session: aiohttp.ClientSession, base_url: str) -> int:
     """Получает максимальное количество страниц пагинации."""
     start_time = time.time()
-    async with aiohttp.ClientSession(headers=headers) as session:
-        try:
-            async with session.get(base_url) as response:
-                response.raise_for_status()
-                soup = BeautifulSoup(await response.text(), "html.parser")
-                pagination = soup.find("div", class_="bx-pagination-container")
-                if not pagination:
-                    logger.info("Пагинация не найдена, возвращаем 1")
-                    return 1
-                pages = pagination.find_all("li")
-                if not pages:
-                    logger.info("Список страниц пуст, возвращаем 1")
-                    return 1
-                last_page = pages[-2].text.strip()
-                result = int(last_page) if last_page.isdigit() else 1
-                logger.info(
-                    f"Найдено {result} страниц пагинации за {time.time() - start_time:.2f} секунд"
-                )
-                return result
-        except aiohttp.ClientError as e:
-            logger.error(f"Ошибка при определении количества страниц: {e}")
-            return 1
+    try:
+        async with session.get(base_url) as response:
+            response.raise_for_status()
+            soup = BeautifulSoup(await response.text(), "html.parser")
+            pagination = soup.find("div", class_="bx-pagination-container")
+            if not pagination:
+                logger.info("Пагинация не найдена, возвращаем 1")
+                return 1
+            pages = pagination.find_all("li")
+            if not pages:
+                logger.info("Список страниц пуст, возвращаем 1")
+                return 1
+            last_page = pages[-2].text.strip()
+            result = int(last_page) if last_page.isdigit() else 1
+            logger.info(
+                f"Найдено {result} страниц пагинации за {time.time() - start_time:.2f} секунд"
+            )
+            return result
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Ошибка при определении количества страниц: {e}")
+        return 1
 
 
 async def fetch_page(
-    page_url: str, headers: dict, retries: int = 3, delay: float = 2.0
+    session: aiohttp.ClientSession, page_url: str, retries: int = 3, delay: float = 2.0
 ) -> Optional[str]:
     """Загружает страницу с ретраями и задержкой для предотвращения тротлинга."""
     start_time = time.time()
-    async with aiohttp.ClientSession(headers=headers) as session:
-        for attempt in range(retries):
-            try:
-                async with session.get(page_url) as response:
-                    response.raise_for_status()
-                    await asyncio.sleep(0.5)  # для предотвращения троттлинга
-                    content = await response.text()
-                    logger.debug(
-                        f"Страница {page_url} загружена за {time.time() - start_time:.2f} секунд"
-                    )
-                    return content
-            except aiohttp.ClientError as e:
-                logger.warning(f"Попытка {attempt + 1} не удалась для {page_url}: {e}")
-                if attempt < retries - 1:
-                    await asyncio.sleep(delay)
-        logger.error(
-            f"Не удалось загрузить страницу {page_url} после {retries} попыток"
-        )
-        return None
+    for attempt in range(retries):
+        try:
+            async with session.get(page_url) as response:
+                response.raise_for_status()
+                await asyncio.sleep(0.5)  # для предотвращения троттлинга
+                content = await response.text()
+                logger.debug(
+                    f"Страница {page_url} загружена за {time.time() - start_time:.2f} секунд"
+                )
+                return content
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Попытка {attempt + 1} не удалась для {page_url}: {e}")
+            if attempt < retries - 1:
+                await asyncio.sleep(delay)
+    logger.error(
+        f"Не удалось загрузить страницу {page_url} после {retries} попыток"
+    )
+    return None
 
 
-async def get_bulletin_urls(start_date: date, end_date: date) -> List[Tuple[str, date]]:
+async def get_bulletin_urls(
+    session: aiohttp.ClientSession, start_date: date, end_date: date
+) -> List[Tuple[str, date]]:
     """Собирает URL бюллетеней за указанный период с учетом пагинации."""
     start_time = time.time()
-    base_url = "https://spimex.com/markets/oil_products/trades/results/"
+    base_url = BASE_URL
     bulletin_urls = []
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-    }
 
-    max_pages = await get_max_pages(base_url, headers)
+    max_pages = await get_max_pages(session, base_url)
 
     semaphore = asyncio.Semaphore(10)  # Ограничение на 10 одновременных запросов
 
@@ -250,7 +173,7 @@ async def get_bulletin_urls(start_date: date, end_date: date) -> List[Tuple[str,
         async with semaphore:
             page_url = f"{base_url}?page=page-{page}" if page > 1 else base_url
             logger.info(f"Обрабатывается страница {page}: {page_url}")
-            return await fetch_page(page_url, headers)
+            return await fetch_page(session, page_url)
 
     tasks = [fetch_page_with_semaphore(page) for page in range(1, max_pages + 1)]
     pages = await asyncio.gather(*tasks)
@@ -283,7 +206,9 @@ async def get_bulletin_urls(start_date: date, end_date: date) -> List[Tuple[str,
     return bulletin_urls
 
 
-async def download_bulletin(url: str, output_path: str) -> bool:
+async def download_bulletin(
+    session: aiohttp.ClientSession, url: str, output_path: str
+) -> bool:
     """Загружает бюллетень по указанному URL асинхронно."""
     start_time = time.time()
     try:
@@ -291,33 +216,240 @@ async def download_bulletin(url: str, output_path: str) -> bool:
             logger.info(f"Файл {output_path} уже существует, пропускаем загрузку")
             return True
 
-        async with aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=10)
-        ) as session:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                content = await response.read()
-                with open(output_path, "wb") as f:
-                    f.write(content)
-                logger.info(
-                    f"Бюллетень загружен: {output_path} за {time.time() - start_time:.2f} секунд"
-                )
-                return True
-    except aiohttp.ClientError as e:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+            response.raise_for_status()
+            content = await response.read()
+            with open(output_path, "wb") as f:
+                f.write(content)
+            logger.info(
+                f"Бюллетень загружен: {output_path} за {time.time() - start_time:.2f} секунд"
+            )
+            return True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error(f"Ошибка при загрузке бюллетеня {url}: {e}")
         return False
 
 
+def create_parse_executor(workers: int, files: int) -> Executor:
+    """Пул для parse_bulletin: read_excel и валидация занимают CPU и держат GIL.
+
+    В пуле процессов разбор идёт на нескольких ядрах, а event loop занят
+    только вводом-выводом. Процессов не больше, чем файлов. Дочерние
+    процессы запускаются через spawn: fork процесса с работающим event loop
+    и потоками драйверов небезопасен. Им достаточно импортировать лёгкий
+    bulletin_parser. При workers <= 0 разбор уходит в
+    отдельный поток — цикл не блокируется, но ядро одно.
+    """
+    if workers <= 0:
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="parse_bulletin")
+    return ProcessPoolExecutor(
+        max_workers=parse_worker_count(workers, files),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+@asynccontextmanager
+async def open_parse_executor(workers: int, files: int) -> AsyncIterator[Executor]:
+    """create_parse_executor, закрываемый без блокировки event loop.
+
+    with executor вызывает shutdown(wait=True) прямо в цикле. При ошибке или
+    отмене API тогда стоял бы, пока процессы дорабатывают очередь. Здесь при
+    ошибке ожидающие задачи отменяются и ожидания нет, а при штатном выходе
+    (задачи уже выполнены) процессы дожидаются в отдельном потоке.
+    """
+    executor = create_parse_executor(workers, files)
+    try:
+        yield executor
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    await asyncio.to_thread(executor.shutdown)
+
+
+def parse_worker_count(workers: int, files: int) -> int:
+    """Число воркеров разбора: не больше файлов и не меньше одного."""
+    return max(1, min(workers, files))
+
+
+async def ensure_partitions(session_factory, trade_dates: Iterable[date]) -> None:
+    """Создаёт недостающие помесячные секции в отдельной короткой транзакции.
+
+    CREATE TABLE ... PARTITION OF берёт ACCESS EXCLUSIVE на всю таблицу, поэтому
+    DDL фиксируется до вставки и не держит блокировку, пока идут upsert'ы.
+    """
+    async with session_factory() as session:
+        for stmt in build_partition_statements(trade_dates):
+            await session.execute(stmt)
+        await session.commit()
+
+
 async def save_batch(session, batch: List[dict]) -> None:
-    """Выполняет вставку одного батча данных в базу данных."""
+    """Выполняет upsert одного батча данных по естественному ключу (секции уже созданы)."""
     try:
-        stmt = insert(SpimexTradingResult).values(batch).on_conflict_do_nothing()
-        await session.execute(stmt)
+        await session.execute(build_upsert_statement(batch))
     except Exception as e:
         logger.error(f"Ошибка при вставке батча из {len(batch)} записей: {e}")
         raise
 
 
+async def refresh_daily_rollup(session, trade_dates: List[date]) -> None:
+    """Пересчитывает дневные итоги только за загруженные торговые даты."""
+    start_time = time.time()
+    for stmt in build_rollup_refresh_statements(trade_dates):
+        await session.execute(stmt)
+    logger.info(
+        f"Дневные итоги обновлены за {len(trade_dates)} дат за {time.time() - start_time:.2f} секунд"
+    )
+
+
+# Сигнал конца потока для следующего этапа конвейера
+_END = None
+
+DOWNLOAD_CONCURRENCY = 10
+
+
+class InsertSummary:
+    """Что загрузка уже зафиксировала в базе; растёт с каждым файлом.
+
+    Остаётся у вызывающего и при ошибке конвейера: зафиксированные до неё
+    файлы всё равно требуют сброса кеша.
+    """
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.batches = 0
+        self.files = 0
+        self.trade_dates: Set[date] = set()
+        self.tags: Set[str] = set()
+
+    def add(self, records: List[dict], batches: int) -> None:
+        self.rows += len(records)
+        self.batches += batches
+        self.files += 1
+        self.trade_dates.update(collect_trade_dates(records))
+        self.tags.update(ingestion_tags(records))
+
+
+async def download_stage(
+    http_session: aiohttp.ClientSession,
+    bulletin_urls: Iterable[Tuple[str, date]],
+    output_dir: str,
+    parse_queue: asyncio.Queue,
+) -> None:
+    """Скачивает бюллетени и передаёт пути на разбор.
+
+    Пока очередь разбора полна, загрузчики ждут — файлы не копятся быстрее,
+    чем их успевают разобрать.
+    """
+    pending = iter(bulletin_urls)
+
+    async def worker() -> None:
+        # Общий итератор: каждый загрузчик берёт следующий URL, когда освободится
+        for url, trade_date in pending:
+            output_path = os.path.join(
+                output_dir, f"oil_xls_{trade_date.strftime('%Y%m%d')}.xls"
+            )
+            with INGESTION_STAGE_LATENCY.time(stage="download"):
+                downloaded = await download_bulletin(http_session, url, output_path)
+            if downloaded:
+                await parse_queue.put((output_path, trade_date))
+
+    async with asyncio.TaskGroup() as group:
+        for _ in range(DOWNLOAD_CONCURRENCY):
+            group.create_task(worker())
+
+
+async def parse_stage(
+    parse_executor: Executor,
+    parse_queue: asyncio.Queue,
+    record_queue: asyncio.Queue,
+    workers: int,
+) -> None:
+    """Разбирает файлы в пуле и передаёт записи каждого файла на вставку."""
+    loop = asyncio.get_running_loop()
+
+    async def worker() -> None:
+        while (item := await parse_queue.get()) is not _END:
+            output_path, trade_date = item
+            with INGESTION_STAGE_LATENCY.time(stage="parse"):
+                records = await loop.run_in_executor(
+                    parse_executor, parse_bulletin, output_path, trade_date
+                )
+            if records:
+                await record_queue.put(records)
+
+    async with asyncio.TaskGroup() as group:
+        for _ in range(workers):
+            group.create_task(worker())
+
+
+async def insert_stage(
+    session,
+    record_queue: asyncio.Queue,
+    summary: InsertSummary,
+    batch_size: int = SPIMEX_INSERT_BATCH_SIZE,
+) -> None:
+    """Вставляет записи по мере разбора, каждый файл — отдельной транзакцией.
+
+    Записи файла режутся на батчи по batch_size, затем пересчитываются
+    дневные итоги его дат и транзакция фиксируется. Блокировки не держатся,
+    пока скачиваются и разбираются следующие файлы, а торговый день
+    появляется в таблицах целиком. Батчи выполняются последовательно:
+    AsyncSession не допускает параллельных запросов на одном соединении.
+    """
+    while (records := await record_queue.get()) is not _END:
+        batches = range(0, len(records), batch_size)
+        for start in batches:
+            with INGESTION_STAGE_LATENCY.time(stage="save"):
+                await save_batch(session, records[start : start + batch_size])
+        with INGESTION_STAGE_LATENCY.time(stage="rollup"):
+            await refresh_daily_rollup(session, collect_trade_dates(records))
+        await session.commit()
+        summary.add(records, len(batches))
+
+
+async def run_pipeline(
+    http_session: aiohttp.ClientSession,
+    bulletin_urls: List[Tuple[str, date]],
+    output_dir: str,
+    session,
+    summary: InsertSummary,
+) -> None:
+    """Запускает загрузку, разбор и вставку одновременно.
+
+    Этапы связаны ограниченными очередями: вставка начинается с первого
+    разобранного файла, а на каждом стыке ждёт не больше
+    SPIMEX_PIPELINE_QUEUE_SIZE файлов, сколько бы дней ни охватывал
+    диапазон. Зафиксированные файлы копятся в summary. Ошибка любого этапа
+    отменяет остальные и пробрасывается как есть — никто не остаётся ждать
+    на очереди, а незафиксированный файл откатывает вызывающий.
+    """
+    parse_workers = parse_worker_count(SPIMEX_PARSE_WORKERS, len(bulletin_urls))
+    parse_queue: asyncio.Queue = asyncio.Queue(maxsize=SPIMEX_PIPELINE_QUEUE_SIZE)
+    record_queue: asyncio.Queue = asyncio.Queue(maxsize=SPIMEX_PIPELINE_QUEUE_SIZE)
+
+    async with open_parse_executor(SPIMEX_PARSE_WORKERS, len(bulletin_urls)) as parse_executor:
+
+        async def download() -> None:
+            await download_stage(http_session, bulletin_urls, output_dir, parse_queue)
+            for _ in range(parse_workers):
+                await parse_queue.put(_END)
+
+        async def parse() -> None:
+            await parse_stage(parse_executor, parse_queue, record_queue, parse_workers)
+            await record_queue.put(_END)
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(download())
+                group.create_task(parse())
+                group.create_task(insert_stage(session, record_queue, summary))
+        except ExceptionGroup as group_error:
+            # Наружу уходит первая ошибка, остальные этапы могли упасть по другим причинам
+            logger.exception(f"Ошибка конвейера загрузки, ошибок этапов: {len(group_error.exceptions)}")
+            raise group_error.exceptions[0]
+
+
 async def process_bulletins_async(
     start_date: date, end_date: date, output_dir: str = "bulletins"
 ) -> None:
@@ -331,57 +463,43 @@ async def process_bulletins_async(
         )
         end_date = date.today()
 
-    bulletin_urls = await get_bulletin_urls(start_date, end_date)
-    all_records = []
+    async with create_http_session() as http_session:
+        with INGESTION_STAGE_LATENCY.time(stage="urls"):
+            bulletin_urls = await get_bulletin_urls(http_session, start_date, end_date)
 
-    semaphore = asyncio.Semaphore(10)
+        session_factory = async_sessionmaker(async_engine)
+        try:
+            await ensure_partitions(session_factory, [trade_date for _, trade_date in bulletin_urls])
+        except Exception as e:
+            logger.error(f"Ошибка при создании секций таблицы: {e}")
+            return
 
-    async def download_with_semaphore(url, trade_date):
-        async with semaphore:
-            output_path = os.path.join(
-                output_dir, f"oil_xls_{trade_date.strftime('%Y%m%d')}.xls"
-            )
-            if await download_bulletin(url, output_path):
-                records = parse_bulletin(output_path, trade_date)
-                return records
-            return []
-
-    tasks = [
-        download_with_semaphore(url, trade_date) for url, trade_date in bulletin_urls
-    ]
-    results = await asyncio.gather(*tasks)
-    for records in results:
-        all_records.extend(records)
-
-    if not all_records:
+        summary = InsertSummary()
+        async with session_factory() as session:
+            try:
+                with INGESTION_STAGE_LATENCY.time(stage="pipeline"):
+                    await run_pipeline(http_session, bulletin_urls, output_dir, session, summary)
+            except Exception as e:
+                # Файлы до ошибки уже зафиксированы — ниже для них сбрасывается кеш
+                logger.error(f"Ошибка при сохранении батчей после {summary.files} файлов: {e}")
+                await session.rollback()
+
+    if not summary.rows:
         logger.info("Нет данных для сохранения в базу")
         return
+    logger.info(
+        f"Сохранено {summary.rows} записей из {summary.files} файлов в {summary.batches} батчах за "
+        f"{time.time() - start_time:.2f} секунд"
+    )
 
-    batch_size = 1000
-    batches = [
-        all_records[i : i + batch_size] for i in range(0, len(all_records), batch_size)
-    ]
-
-    # Параллельное сохранение батчей
-    async with async_sessionmaker(async_engine)() as session:
-        try:
-            start_batch_time = time.time()
-
-            insert_tasks = [save_batch(session, batch) for batch in batches]
-
-            await asyncio.gather(*insert_tasks)
-
-            await session.commit()
-            logger.info(
-                f"Сохранено {len(all_records)} записей в {len(batches)} батчах за "
-                f"{time.time() - start_batch_time:.2f} секунд"
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении батчей: {e}")
-            await session.rollback()
+    # Сбрасываются только ответы за загруженные месяцы и oil_id, история остаётся в кеше
+    with INGESTION_STAGE_LATENCY.time(stage="invalidate"):
+        await invalidate_tags(sorted(summary.tags))
+        # Версия растёт после сброса: новый ETag не достанется ответу из старого кеша
+        await bump_data_version()
 
     logger.info(
-        f"Обработка завершена: сохранено {len(all_records)} записей за {time.time() - start_time:.2f} секунд"
+        f"Обработка завершена: сохранено {summary.rows} записей за {time.time() - start_time:.2f} секунд"
     )
 
 
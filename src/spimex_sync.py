@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import time
@@ -6,10 +7,15 @@ from typing import List, Optional, Tuple
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
+from cache import bump_data_version, close_redis, ingestion_tags, invalidate_tags
 from database import SyncSession
-from models import SpimexTradingResult
-from trading_result_schema import TradingResultModel
-from sqlalchemy.dialects.postgresql import insert
+from repository import (
+    build_partition_statements,
+    build_rollup_refresh_statements,
+    build_upsert_statement,
+    collect_trade_dates,
+)
+from trading_result_schema import TradingResultCreate
 
 logger = logging.getLogger(__name__)
 
@@ -121,7 +127,7 @@ def parse_bulletin(file_path: str, trade_date: date) -> List[dict]:
 
         from pydantic import TypeAdapter
 
-        adapter = TypeAdapter(List[TradingResultModel])
+        adapter = TypeAdapter(List[TradingResultCreate])
         records = adapter.validate_python(data_df.to_dict(orient="records"))
 
         result = [record.dict(by_alias=False) for record in records]
@@ -202,6 +208,17 @@ def sync_get_bulletin_urls(start_date: date, end_date: date) -> List[Tuple[str,
     logger.info(f"Всего найдено {len(bulletin_urls)} подходящих бюллетеней")
     return bulletin_urls
 
+async def invalidate_ingested(records: List[dict]) -> None:
+    """Сбрасывает кеш по тегам загруженных записей и увеличивает версию данных."""
+    try:
+        await invalidate_tags(ingestion_tags(records))
+        # Версия растёт после сброса: новый ETag не достанется ответу из старого кеша
+        await bump_data_version()
+    finally:
+        # Клиент привязан к циклу asyncio.run и после него непригоден
+        await close_redis()
+
+
 def process_bulletins_sync(start_date: date, end_date: date, output_dir: str = "bulletins") -> None:
     """Обрабатывает бюллетени за указанный период синхронно."""
     start_time = time.time()
@@ -235,20 +252,47 @@ def process_bulletins_sync(start_date: date, end_date: date, output_dir: str = "
         logger.info("Нет данных для сохранения в базу")
         return
 
+    # Секции создаются и фиксируются отдельно: DDL блокирует всю таблицу и не должен ждать вставки
+    trade_dates = collect_trade_dates(all_records)
+    with SyncSession() as session:
+        try:
+            for stmt in build_partition_statements(trade_dates):
+                session.execute(stmt)
+            session.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при создании секций таблицы: {e}")
+            session.rollback()
+            return
+
     batch_size = 1000
     batches = [all_records[i : i + batch_size] for i in range(0, len(all_records), batch_size)]
+    saved_records = []
 
     for batch in batches:
         with SyncSession() as session:
             try:
-                stmt = insert(SpimexTradingResult).values(batch).on_conflict_do_nothing()
-                session.execute(stmt)
+                session.execute(build_upsert_statement(batch))
                 session.commit()
+                saved_records.extend(batch)
                 logger.info(f"Сохранен батч из {len(batch)} записей")
             except Exception as e:
                 logger.error(f"Ошибка при сохранении батча: {e}")
                 session.rollback()
 
+    with SyncSession() as session:
+        try:
+            for stmt in build_rollup_refresh_statements(trade_dates):
+                session.execute(stmt)
+            session.commit()
+            logger.info(f"Дневные итоги обновлены за {len(trade_dates)} дат")
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении дневных итогов: {e}")
+            session.rollback()
+
+    if saved_records:
+        # Без сброса API отдавал бы прежние ответы и 304 по старому ETag до суточного сброса
+        asyncio.run(invalidate_ingested(saved_records))
+
     logger.info(
         f"Сохранено {len(all_records)} записей в {len(batches)} батчах за {time.time() - start_time:.2f} секунд"
     )
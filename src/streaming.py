@@ -0,0 +1,117 @@
+import csv
+import io
+import logging
+from datetime import date, datetime
+from typing import AsyncIterator, Literal, Optional, Sequence
+
+import orjson
+from database import ReadSessionLocal
+from fastapi.responses import StreamingResponse
+from metrics import ROW_BUCKETS, Histogram
+from sqlalchemy import Select
+from trading_result_schema import TradingResultModel
+
+logger = logging.getLogger(__name__)
+
+# Строки, отданные эндпоинтом: ответы из кеша сюда не попадают, только вычисленные
+ENDPOINT_ROWS = Histogram(
+    "spimex_endpoint_rows", "Число строк в вычисленных ответах эндпоинтов", ("endpoint",), buckets=ROW_BUCKETS
+)
+
+StreamFormat = Literal["ndjson", "csv"]
+
+# Размер порции строк, которую сервер отдаёт курсором и кодируем за раз
+STREAM_CHUNK_SIZE = 1000
+
+STREAM_COLUMNS = list(TradingResultModel.model_fields)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def row_values(row, columns: Sequence[str]) -> list:
+    """Достаёт значения колонок из ORM-объекта или строки Core.
+
+    У строк Core обращение через атрибут конфликтует с методами tuple
+    (например, count), поэтому для них используется _mapping.
+    """
+    mapping = getattr(row, "_mapping", None)
+    if mapping is not None:
+        return [mapping[column] for column in columns]
+    return [getattr(row, column) for column in columns]
+
+
+def encode_ndjson_chunk(rows: Sequence, columns: Sequence[str] = STREAM_COLUMNS) -> bytes:
+    """Кодирует порцию строк в NDJSON: по одному объекту на строку."""
+    return b"".join(
+        orjson.dumps(dict(zip(columns, row_values(row, columns))), option=orjson.OPT_APPEND_NEWLINE)
+        for row in rows
+    )
+
+
+def encode_csv_chunk(
+    rows: Sequence, columns: Sequence[str] = STREAM_COLUMNS, header: bool = False
+) -> bytes:
+    """Кодирует порцию строк в CSV, при необходимости с заголовком."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow(
+            [
+                value.isoformat() if isinstance(value, (date, datetime)) else value
+                for value in row_values(row, columns)
+            ]
+        )
+    return buffer.getvalue().encode()
+
+
+async def iter_stream(
+    query: Select,
+    output_format: StreamFormat,
+    columns: Optional[Sequence[str]] = None,
+    endpoint: str = "stream",
+) -> AsyncIterator[bytes]:
+    """Читает результат серверным курсором и отдаёт его порциями байт.
+
+    Сессия открывается внутри генератора, а не через get_read_db: зависимость
+    закрывается до того, как StreamingResponse начинает отдавать тело.
+    Если заданы columns, запрос — проекция Core и строки не гидрируются в ORM.
+    """
+    output_columns = columns or STREAM_COLUMNS
+    if output_format == "csv":
+        yield encode_csv_chunk([], output_columns, header=True)
+
+    total = 0
+    execution_options = {"yield_per": STREAM_CHUNK_SIZE}
+    async with ReadSessionLocal() as session:
+        if columns is None:
+            result = await session.stream_scalars(query, execution_options=execution_options)
+        else:
+            result = await session.stream(query, execution_options=execution_options)
+        async for partition in result.partitions(STREAM_CHUNK_SIZE):
+            total += len(partition)
+            if output_format == "csv":
+                yield encode_csv_chunk(partition, output_columns)
+            else:
+                yield encode_ndjson_chunk(partition, output_columns)
+    ENDPOINT_ROWS.observe(total, endpoint=endpoint)
+    logger.info(f"Отдано потоком {total} строк в формате {output_format}")
+
+
+def stream_trading_results(
+    query: Select,
+    output_format: StreamFormat,
+    limit: Optional[int] = None,
+    columns: Optional[Sequence[str]] = None,
+    endpoint: str = "stream",
+) -> StreamingResponse:
+    """Оборачивает запрос в потоковый ответ NDJSON или CSV."""
+    if limit is not None:
+        query = query.limit(limit)
+    return StreamingResponse(
+        iter_stream(query, output_format, columns, endpoint), media_type=MEDIA_TYPES[output_format]
+    )
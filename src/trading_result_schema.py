@@ -17,3 +17,20 @@ class TradingResultModel(BaseModel):
     date: date
     created_on: datetime
     updated_on: datetime
+
+
+class TradingResultCreate(BaseModel):
+    """Строка бюллетеня до вставки: id назначает база данных."""
+
+    exchange_product_id: str
+    exchange_product_name: str
+    oil_id: str
+    delivery_basis_id: str
+    delivery_basis_name: str
+    delivery_type_id: str
+    volume: float
+    total: float
+    count: int
+    date: date
+    created_on: datetime
+    updated_on: datetime
@@ -1,20 +1,64 @@
 import pytest
-from unittest.mock import AsyncMock, patch
-from src.cache import get_redis_client, cache_response, clear_cache
+from datetime import date
+from typing import Optional
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import Query, Response
+from fastapi.responses import StreamingResponse
+from src.cache import (
+    cache_response,
+    clear_cache,
+    default_cache_tags,
+    get_redis_client,
+    ingestion_tags,
+    invalidate_tags,
+    local_cache,
+    normalize_cache_args,
+)
+from src.circuit_breaker import CircuitBreaker
+from src.local_cache import LocalTTLCache
+from redis.exceptions import ConnectionError as RedisConnectionError
+import src.cache as cache_module
 import redis.asyncio as redis
 
 
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    local_cache.clear()
+    cache_module._forget_generations()
+    cache_module.redis_breaker.record_success()
+    yield
+    local_cache.clear()
+    cache_module._generations.clear()
+    cache_module._popularity.clear()
+
+
 @pytest.fixture
 def mock_redis_client():
     mock_client = AsyncMock(spec=redis.Redis)
     mock_client.ping = AsyncMock(return_value=True)
     mock_client.get = AsyncMock(return_value=None)
     mock_client.setex = AsyncMock(return_value=True)
+    mock_client.set = AsyncMock(return_value=True)
+    mock_client.eval = AsyncMock(return_value=1)
     mock_client.keys = AsyncMock(return_value=[])
     mock_client.delete = AsyncMock(return_value=0)
+    mock_client.publish = AsyncMock(return_value=1)
+    mock_client.hgetall = AsyncMock(return_value={})
+    mock_client.hget = AsyncMock(return_value=None)
+    mock_client.hincrby = AsyncMock(return_value=1)
+    mock_client.unlink = AsyncMock(side_effect=lambda *keys: len(keys))
     return mock_client
 
 
+def scan_results(keys):
+    async def scan_iter(match=None, count=None):
+        for key in keys:
+            yield key
+
+    return scan_iter
+
+
 @pytest.mark.asyncio
 async def test_get_redis_client_success(mock_redis_client):
     with patch("src.cache.redis.Redis", return_value=mock_redis_client):
@@ -42,11 +86,477 @@ async def test_cache_response_decorator_hit(mock_redis_client):
 
 @pytest.mark.asyncio
 async def test_clear_cache_success(mock_redis_client):
-    mock_redis_client.keys = AsyncMock(return_value=["key1", "key2"])
-    mock_redis_client.delete = AsyncMock(return_value=2)
-
     with patch("src.cache.get_redis_client", return_value=mock_redis_client):
         success = await clear_cache("test_pattern:*")
         assert success is True
-        mock_redis_client.keys.assert_awaited_once_with("test_pattern:*")
-        mock_redis_client.delete.assert_awaited_once_with("key1", "key2")
+        mock_redis_client.hincrby.assert_awaited_once_with("cache:generations", "test_pattern", 1)
+        mock_redis_client.keys.assert_not_called()
+        mock_redis_client.delete.assert_not_called()
+        mock_redis_client.publish.assert_awaited_once_with("cache:invalidate", "test_pattern:*")
+
+
+def test_normalize_cache_args_collapses_order_and_defaults():
+    async def endpoint(
+        db=None,
+        start_date: date = Query(...),
+        oil_id: Optional[str] = Query(None),
+        limit: Optional[int] = Query(100),
+    ):
+        pass
+
+    explicit = normalize_cache_args(
+        endpoint, (), {"limit": 100, "oil_id": None, "start_date": date(2024, 1, 1), "db": object()}
+    )
+    omitted = normalize_cache_args(endpoint, (), {"start_date": date(2024, 1, 1)})
+    assert explicit == omitted == {"start_date": "2024-01-01", "limit": 100}
+
+
+@pytest.mark.asyncio
+async def test_cache_response_stores_response_body_and_ttl(mock_redis_client):
+    @cache_response(key_prefix="test_prefix", ttl_resolver=lambda args: 3600)
+    async def mock_func(oil_id: str):
+        return Response(content=b'[{"id":1}]', media_type="application/json", headers={"X-Next-Cursor": "abc"})
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        await mock_func(oil_id="A100")
+        key, ttl, value = mock_redis_client.setex.await_args.args
+        assert key == 'test_prefix:mock_func:{"oil_id": "A100"}'
+        assert ttl == 3600
+
+        mock_redis_client.get = AsyncMock(return_value=value)
+        cached = await mock_func(oil_id="A100")
+        assert isinstance(cached, Response)
+        assert cached.body == b'[{"id":1}]'
+        assert cached.headers["x-next-cursor"] == "abc"
+
+
+@pytest.mark.asyncio
+async def test_cache_response_skips_streaming(mock_redis_client):
+    async def body():
+        yield b"{}\n"
+
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func():
+        return StreamingResponse(body())
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        result = await mock_func()
+        assert isinstance(result, StreamingResponse)
+        mock_redis_client.setex.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cache_response_serves_local_hit_without_redis(mock_redis_client):
+    calls = []
+
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func(oil_id: str):
+        calls.append(oil_id)
+        return {"data": oil_id}
+
+    hits = cache_module.CACHE_HITS.value(prefix="test_prefix", tier="local")
+    misses = cache_module.CACHE_MISSES.value(prefix="test_prefix")
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client) as get_client:
+        assert await mock_func(oil_id="A100") == {"data": "A100"}
+        assert await mock_func(oil_id="A100") == {"data": "A100"}
+        assert calls == ["A100"]
+        assert get_client.await_count == 1
+        mock_redis_client.get.assert_awaited_once()
+        assert cache_module.CACHE_HITS.value(prefix="test_prefix", tier="local") == hits + 1
+        assert cache_module.CACHE_MISSES.value(prefix="test_prefix") == misses + 1
+
+        await clear_cache("test_prefix:*")
+        assert await mock_func(oil_id="A100") == {"data": "A100"}
+        assert calls == ["A100", "A100"]
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalTTLCache(max_entries=2, max_bytes=100, max_ttl=60)
+    cache.set("a", 1, 60, 10)
+    cache.set("b", 2, 60, 10)
+    assert cache.get("a") == 1
+    cache.set("c", 3, 60, 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    cache.set("big", 4, 60, 95)
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == 95
+    cache.set("huge", 5, 60, 101)
+    assert cache.get("huge") is None
+
+
+def test_local_cache_expires_and_invalidates_by_pattern():
+    cache = LocalTTLCache(max_entries=10, max_bytes=100, max_ttl=5)
+    with patch("src.local_cache.time.monotonic", return_value=100.0):
+        cache.set("dynamics:a", 1, 3600, 1)
+        cache.set("trading_results:a", 2, 3600, 1)
+    with patch("src.local_cache.time.monotonic", return_value=104.0):
+        assert cache.invalidate("dynamics:*") == 1
+        assert cache.get("trading_results:a") == 2
+    with patch("src.local_cache.time.monotonic", return_value=106.0):
+        assert cache.get("trading_results:a") is None
+
+
+@pytest.mark.asyncio
+async def test_cache_response_coalesces_concurrent_misses(mock_redis_client):
+    release = asyncio.Event()
+    calls = []
+
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func(oil_id: str):
+        calls.append(oil_id)
+        await release.wait()
+        return {"data": oil_id}
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        tasks = [asyncio.create_task(mock_func(oil_id="A100")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+    assert results == [{"data": "A100"}] * 5
+    assert calls == ["A100"]
+    mock_redis_client.setex.assert_awaited_once()
+    stale_key = mock_redis_client.set.await_args_list[-1].args[0]
+    assert stale_key == 'stale:test_prefix:mock_func:{"oil_id": "A100"}'
+    tag_call, release_call = mock_redis_client.eval.await_args_list
+    assert "tag:endpoint:test_prefix" in tag_call.args
+    assert release_call.args[2] == 'lock:test_prefix:mock_func:{"oil_id": "A100"}'
+
+
+@pytest.mark.asyncio
+async def test_recompute_not_cached_when_tags_invalidated_meanwhile(mock_redis_client):
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func(oil_id: str):
+        return {"data": oil_id}
+
+    key = 'test_prefix:mock_func:{"oil_id": "A100"}'
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        # Загрузка сбросила теги, пока эндпоинт читал БД, — результат мог устареть
+        mock_redis_client.hget = AsyncMock(side_effect=[b"1", b"2"])
+        assert await mock_func(oil_id="A100") == {"data": "A100"}
+        mock_redis_client.setex.assert_not_called()
+
+        # Сброс прошёл уже во время записи — записанное удаляется
+        mock_redis_client.hget = AsyncMock(side_effect=[b"2", b"2", b"3"])
+        assert await mock_func(oil_id="A100") == {"data": "A100"}
+        mock_redis_client.setex.assert_awaited_once()
+        mock_redis_client.unlink.assert_awaited_once_with(key, "stale:" + key)
+
+    assert local_cache.get(key) is None
+
+
+@pytest.mark.asyncio
+async def test_cache_response_serves_stale_while_peer_recomputes(mock_redis_client):
+    async def get(key):
+        return '{"data": "stale"}' if key.startswith("stale:") else None
+
+    mock_redis_client.get = AsyncMock(side_effect=get)
+    mock_redis_client.set = AsyncMock(return_value=None)
+
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func(oil_id: str):
+        raise AssertionError("ключ пересчитывает другой воркер")
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        assert await mock_func(oil_id="A100") == {"data": "stale"}
+        mock_redis_client.setex.assert_not_called()
+        mock_redis_client.eval.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_clear_cache_unlinks_arbitrary_pattern_keeping_stale(mock_redis_client):
+    mock_redis_client.scan_iter = scan_results(["dynamics:a", "stale:dynamics:a"])
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        assert await clear_cache("*:a") is True
+        mock_redis_client.unlink.assert_awaited_once_with("dynamics:a")
+        mock_redis_client.hincrby.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_clear_cache_bumps_generation_and_keeps_stale_key(mock_redis_client):
+    calls = []
+
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func(oil_id: str):
+        calls.append(oil_id)
+        return {"data": oil_id}
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        await mock_func(oil_id="A100")
+        await clear_cache("test_prefix:*")
+        await mock_func(oil_id="A100")
+
+    first_key, second_key = [call.args[0] for call in mock_redis_client.setex.await_args_list]
+    assert first_key == 'test_prefix:mock_func:{"oil_id": "A100"}'
+    assert second_key == first_key + ":g1"
+    stale_keys = {call.args[0] for call in mock_redis_client.set.await_args_list if call.args[0].startswith("stale:")}
+    assert stale_keys == {"stale:" + first_key}
+    assert calls == ["A100", "A100"]
+
+
+def test_default_cache_tags_scope_dates_and_oil():
+    assert default_cache_tags(
+        "dynamics", {"start_date": "2024-01-15", "end_date": "2024-03-01", "oil_id": "A100"}
+    ) == [
+        "endpoint:dynamics",
+        "month:2024-01:oil:A100",
+        "month:2024-02:oil:A100",
+        "month:2024-03:oil:A100",
+    ]
+    assert default_cache_tags("trading_results", {"limit": 100}) == ["endpoint:trading_results", "latest"]
+    assert default_cache_tags("dynamics", {"start_date": "1990-01-01", "end_date": "2024-01-01"})[1:] == [
+        "latest"
+    ]
+
+
+def test_ingestion_tags_cover_inserted_months_and_products():
+    records = [
+        {"date": date(2024, 5, 2), "oil_id": "A100"},
+        {"date": date(2024, 5, 3), "oil_id": "A592"},
+    ]
+    assert ingestion_tags(records) == [
+        "latest",
+        "latest:oil:A100",
+        "latest:oil:A592",
+        "month:2024-05",
+        "month:2024-05:oil:A100",
+        "month:2024-05:oil:A592",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_invalidate_tags_drops_tagged_keys_everywhere(mock_redis_client):
+    key = 'dynamics:get_dynamics:{"end_date": "2024-05-31"}'
+    local_cache.set(key, {"data": 1}, 60, 10)
+    local_cache.set("dynamics:other", {"data": 2}, 60, 10)
+    mock_redis_client.eval = AsyncMock(return_value=[key])
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        assert await invalidate_tags(["month:2024-05"]) is True
+
+    assert mock_redis_client.eval.await_args.args[1:] == (
+        2, "cache:data_version", "tag:month:2024-05", "invalidations"
+    )
+    assert local_cache.get(key) is None
+    assert local_cache.get("dynamics:other") == {"data": 2}
+    mock_redis_client.publish.assert_awaited_once()
+
+
+def test_circuit_breaker_opens_then_probes_with_backoff():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=1, max_reset_timeout=3)
+    with patch("src.circuit_breaker.time.monotonic", return_value=100.0):
+        breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow_request()
+    with patch("src.circuit_breaker.time.monotonic", return_value=101.0):
+        assert breaker.allow_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow_request()
+        breaker.record_failure()
+    with patch("src.circuit_breaker.time.monotonic", return_value=102.5):
+        assert not breaker.allow_request()
+    with patch("src.circuit_breaker.time.monotonic", return_value=103.0):
+        assert breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_cache_response_bypasses_redis_while_breaker_open(mock_redis_client):
+    mock_redis_client.get = AsyncMock(side_effect=RedisConnectionError("connection refused"))
+    calls = []
+
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func(oil_id: str):
+        calls.append(oil_id)
+        return {"data": oil_id}
+
+    with patch.object(cache_module, "redis_client", mock_redis_client):
+        for _ in range(cache_module.redis_breaker.failure_threshold + 2):
+            assert await mock_func(oil_id="A100") == {"data": "A100"}
+
+    assert cache_module.redis_breaker.state == CircuitBreaker.OPEN
+    assert mock_redis_client.get.await_count == cache_module.redis_breaker.failure_threshold
+    mock_redis_client.set.assert_not_called()
+    assert len(calls) == cache_module.redis_breaker.failure_threshold + 2
+
+
+@pytest.mark.asyncio
+async def test_cache_response_stores_large_body_gzipped(mock_redis_client):
+    body = b"[" + b",".join(b'{"id":%d,"oil_id":"A100","volume":60.0}' % i for i in range(200)) + b"]"
+
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func():
+        return Response(content=body, media_type="application/json")
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        await mock_func()
+        stored = mock_redis_client.setex.await_args.args[2]
+        assert isinstance(stored, bytes) and len(stored) < len(body) // 4
+
+        local_cache.clear()
+        mock_redis_client.get = AsyncMock(return_value=stored)
+        plain = await mock_func()
+        assert plain.body == body
+        assert "content-encoding" not in plain.headers
+
+        token = cache_module._accept_encoding.set("gzip, deflate, br")
+        try:
+            compressed = await mock_func()
+        finally:
+            cache_module._accept_encoding.reset(token)
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert compressed.body == stored.split(b"\n", 1)[1]
+
+
+def test_accepts_gzip_respects_q_values():
+    for header, expected in [
+        ("gzip", True),
+        ("br;q=1.0, gzip;q=0.5", True),
+        ("gzip;q=0, *", False),
+        ("*", True),
+        ("identity", False),
+        ("", False),
+    ]:
+        token = cache_module._accept_encoding.set(header)
+        try:
+            assert cache_module._accepts_gzip() is expected, header
+        finally:
+            cache_module._accept_encoding.reset(token)
+
+
+@pytest.mark.asyncio
+async def test_popularity_is_flushed_to_sorted_set(mock_redis_client):
+    pipe = MagicMock()
+    pipe.__aenter__.return_value = pipe
+    pipe.execute = AsyncMock(return_value=[])
+    mock_redis_client.pipeline = MagicMock(return_value=pipe)
+
+    @cache_response(key_prefix="test_prefix")
+    async def mock_func(oil_id: str):
+        return {"data": oil_id}
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        for _ in range(3):
+            await mock_func(oil_id="A100")
+        await cache_module.flush_popularity()
+
+    pipe.zincrby.assert_called_once_with("cache:popularity", 3, 'test_prefix:{"oil_id": "A100"}')
+    pipe.zremrangebyrank.assert_called_once()
+    pipe.execute.assert_awaited_once()
+    assert not cache_module._popularity
+
+
+@pytest.mark.asyncio
+async def test_warm_cache_replays_popular_queries_with_typed_args(mock_redis_client):
+    mock_redis_client.zrevrange = AsyncMock(
+        return_value=[
+            b'warm_prefix:{"end_date": "2024-01-31", "start_date": "2024-01-01"}',
+            b'unknown_prefix:{}',
+        ]
+    )
+    seen = []
+
+    @cache_response(key_prefix="warm_prefix")
+    async def endpoint(
+        db=None,
+        start_date: date = Query(...),
+        end_date: date = Query(...),
+        limit: Optional[int] = Query(100),
+    ):
+        seen.append((db, start_date, end_date, limit))
+        return {"rows": []}
+
+    class Session:
+        async def __aenter__(self):
+            return "session"
+
+        async def __aexit__(self, *exc):
+            return False
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        warmed = await cache_module.warm_cache(Session, top_n=10, concurrency=2)
+
+    assert warmed == 1
+    assert seen == [("session", date(2024, 1, 1), date(2024, 1, 31), 100)]
+    mock_redis_client.zrevrange.assert_awaited_once_with("cache:popularity", 0, 9)
+    mock_redis_client.setex.assert_awaited_once()
+    assert not cache_module._popularity
+
+
+async def start_resp_server(delay: float, commands: list):
+    """Минимальный Redis по RESP2: отвечает с задержкой, чтобы команды шли одновременно."""
+    replies = {b"PING": b"+PONG\r\n", b"GET": b"$-1\r\n", b"HGETALL": b"*0\r\n", b"HGET": b"$-1\r\n", b"EVAL": b":1\r\n"}
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                args = []
+                for _ in range(int(line[1:])):
+                    size = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                commands.append(args[0].upper())
+                await asyncio.sleep(delay)
+                writer.write(replies.get(args[0].upper(), b"+OK\r\n"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+@pytest.mark.asyncio
+async def test_pool_exhaustion_keeps_breaker_closed():
+    """Запросов больше, чем соединений в пуле: команды ждут соединение, цепь не размыкается."""
+    commands = []
+    server = await start_resp_server(0.01, commands)
+    port = server.sockets[0].getsockname()[1]
+
+    @cache_response(key_prefix="burst")
+    async def endpoint(n: int):
+        return {"n": n}
+
+    with patch("src.cache.REDIS_HOST", "127.0.0.1"), patch("src.cache.REDIS_PORT", str(port)), patch(
+        "src.cache.REDIS_MAX_CONNECTIONS", 2
+    ), patch("src.cache.redis_client", None):
+        try:
+            results = await asyncio.gather(*(endpoint(n=i) for i in range(20)))
+        finally:
+            await cache_module.close_redis()
+            server.close()
+            await server.wait_closed()
+
+    assert results == [{"n": i} for i in range(20)]
+    assert cache_module.redis_breaker.state == CircuitBreaker.CLOSED
+    assert commands.count(b"SETEX") == 20
+
+
+@pytest.mark.asyncio
+async def test_daily_reset_runs_once_across_workers(mock_redis_client):
+    """Ключ дня захватывает один воркер: очистка, ослабление и прогрев выполняются один раз."""
+    mock_redis_client.set = AsyncMock(side_effect=[True, None])
+    mock_redis_client.zunionstore = AsyncMock(return_value=1)
+    on_reset = AsyncMock()
+    local_cache.set("dynamics:k", {"data": 1}, 60, 10)
+
+    with patch("src.cache.get_redis_client", return_value=mock_redis_client):
+        await cache_module.run_daily_reset(on_reset)
+        hincrby_calls = mock_redis_client.hincrby.await_count
+        local_cache.set("dynamics:k", {"data": 1}, 60, 10)
+        # Второй воркер: ключ уже стоит — только локальный уровень
+        await cache_module.run_daily_reset(on_reset)
+
+    lock_key = mock_redis_client.set.await_args_list[0].args[0]
+    assert lock_key.startswith("cache:reset:")
+    assert mock_redis_client.set.await_args_list[1].args[0] == lock_key
+    assert mock_redis_client.hincrby.await_count == hincrby_calls
+    mock_redis_client.zunionstore.assert_awaited_once()
+    on_reset.assert_awaited_once()
+    assert local_cache.get("dynamics:k") is None
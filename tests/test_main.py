@@ -1,9 +1,22 @@
+import json
 import pytest
 from httpx import AsyncClient
-from unittest.mock import AsyncMock, patch
-from datetime import date, datetime
-from src.app.main import app, get_db
+from unittest.mock import AsyncMock, MagicMock, patch
+from datetime import date, datetime, timezone
+from src.app.main import app, get_read_db, refresh_catalog_if_stale
 from src.models import SpimexTradingResult
+from src.pagination import decode_cursor, encode_cursor
+from src.fast_json import encode_trading_results
+from src.trading_result_schema import TradingResultModel
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from typing import List
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+import catalog
+import database
+import metrics
+from cache import DataVersion
 
 
 class ScalarResultMock:
@@ -21,6 +34,21 @@ class ExecuteResultMock:
     def scalars(self):
         return ScalarResultMock(self._data)
 
+    def all(self):
+        return self._data
+
+
+class RowMock:
+    """Строка Core: значения доступны через _mapping, ключ курсора — атрибутами."""
+
+    def __init__(self, **values):
+        self._mapping = values
+        self.date = values.get("date")
+        self.id = values.get("id")
+
+    def __iter__(self):
+        return iter(self._mapping.values())
+
 
 @pytest.fixture
 def mock_db_session():
@@ -30,7 +58,7 @@ def mock_db_session():
 
 @pytest.fixture
 def client(mock_db_session):
-    app.dependency_overrides[get_db] = lambda: mock_db_session
+    app.dependency_overrides[get_read_db] = lambda: mock_db_session
 
     def _client():
         return AsyncClient(app=app, base_url="http://test")
@@ -55,6 +83,49 @@ async def test_get_last_trading_dates(client, mock_db_session):
     assert response.json() == {"last_trading_dates": ["2024-07-01", "2024-06-30"]}
 
 
+@pytest.mark.asyncio
+async def test_get_last_trading_dates_conditional_get(client, mock_db_session):
+    mock_db_session.execute = AsyncMock(return_value=ExecuteResultMock([date(2024, 7, 1)]))
+    version = DataVersion(7, datetime(2024, 7, 1, 14, 0, 0, tzinfo=timezone.utc))
+
+    with patch("conditional.current_data_version", new=AsyncMock(return_value=version)):
+        async with client() as ac:
+            response = await ac.get("/get_last_trading_dates", params={"count": 1})
+            etag = response.headers["etag"]
+            assert response.status_code == 200
+            assert etag.startswith('W/"7-')
+            assert response.headers["last-modified"] == "Mon, 01 Jul 2024 14:00:00 GMT"
+            assert response.headers["cache-control"].startswith("public, max-age=")
+
+            mock_db_session.execute.reset_mock()
+            labels = {"method": "GET", "route": "/get_last_trading_dates", "status": "304"}
+            observed = metrics.REQUEST_LATENCY.count(**labels)
+            not_modified = await ac.get(
+                "/get_last_trading_dates", params={"count": 1}, headers={"If-None-Match": etag}
+            )
+            assert not_modified.status_code == 304
+            assert not_modified.headers["etag"] == etag
+            assert not_modified.content == b""
+            mock_db_session.execute.assert_not_awaited()
+            # 304 отдаётся до маршрутизатора, но метка route — всё равно шаблон пути
+            assert metrics.REQUEST_LATENCY.count(**labels) == observed + 1
+
+            other_query = await ac.get(
+                "/get_last_trading_dates", params={"count": 2}, headers={"If-None-Match": etag}
+            )
+            assert other_query.status_code == 200
+
+    with patch(
+        "conditional.current_data_version", new=AsyncMock(return_value=DataVersion(8, version.updated_at))
+    ):
+        async with client() as ac:
+            changed = await ac.get(
+                "/get_last_trading_dates", params={"count": 1}, headers={"If-None-Match": etag}
+            )
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
 @pytest.mark.asyncio
 async def test_get_dynamics(client, mock_db_session):
     mock_data = [
@@ -106,11 +177,398 @@ async def test_get_dynamics(client, mock_db_session):
     assert response.json()[1]["exchange_product_id"] == "A002"
 
 
+def make_trading_result(row_id, trade_date):
+    return SpimexTradingResult(
+        id=row_id,
+        exchange_product_id=f"A{row_id:03d}",
+        exchange_product_name=f"Test Oil {row_id}",
+        oil_id="A00",
+        delivery_basis_id="BAS",
+        delivery_basis_name="Basis",
+        delivery_type_id="T",
+        volume=100.0,
+        total=10000.0,
+        count=10,
+        date=trade_date,
+        created_on=datetime(2024, 7, 1, 10, 0, 0),
+        updated_on=datetime(2024, 7, 1, 10, 0, 0),
+    )
+
+
+def test_fast_encoder_matches_fastapi_serialization():
+    rows = [make_trading_result(1, date(2024, 1, 1)), make_trading_result(2, date(2024, 1, 2))]
+    rows[1].exchange_product_name = "Бензин АИ-92"
+    rows[1].updated_on = datetime(2024, 7, 1, 10, 0, 0, 123456)
+    rows[1].total = 1234567.89
+
+    adapter = TypeAdapter(List[TradingResultModel])
+    expected = JSONResponse(
+        adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+    ).body
+    assert encode_trading_results(rows) == expected
+
+
+def test_dynamics_ttl_long_only_for_closed_ranges():
+    from src.app.main import dynamics_ttl
+
+    with patch("src.app.main.latest_trade_date", return_value=date(2024, 7, 1)):
+        assert dynamics_ttl({"end_date": "2024-06-28"}) == 7 * 24 * 3600
+        assert dynamics_ttl({"end_date": "2024-07-01"}) is None
+    with patch("src.app.main.latest_trade_date", return_value=None):
+        assert dynamics_ttl({"end_date": "2024-06-28"}) is None
+
+
+def test_cursor_round_trip():
+    token = encode_cursor(date(2024, 1, 2), 42)
+    assert decode_cursor(token) == (date(2024, 1, 2), 42)
+
+
+@pytest.mark.asyncio
+async def test_get_dynamics_keyset_page(client, mock_db_session):
+    # limit=2 -> запрос выбирает 3 строки, третья лишь сигнализирует о следующей странице
+    mock_data = [
+        make_trading_result(1, date(2024, 1, 1)),
+        make_trading_result(2, date(2024, 1, 2)),
+        make_trading_result(3, date(2024, 1, 2)),
+    ]
+    statements = []
+
+    async def execute_mock(statement, *args, **kwargs):
+        statements.append(statement)
+        return ExecuteResultMock(mock_data)
+
+    mock_db_session.execute = execute_mock
+
+    cursor = encode_cursor(date(2023, 12, 31), 99)
+    async with client() as ac:
+        response = await ac.get(
+            "/get_dynamics",
+            params={
+                "start_date": "2024-01-01",
+                "end_date": "2024-01-31",
+                "limit": 2,
+                "cursor": cursor,
+            },
+        )
+
+    assert response.status_code == 200
+    assert [row["id"] for row in response.json()] == [1, 2]
+    assert decode_cursor(response.headers["X-Next-Cursor"]) == (date(2024, 1, 2), 2)
+    sql = str(statements[0])
+    assert "OFFSET" not in sql
+    assert "(spimex_trading_results.date, spimex_trading_results.id) >" in sql
+
+
+@pytest.mark.asyncio
+async def test_get_trading_results_last_page_has_no_cursor(client, mock_db_session):
+    mock_data = [make_trading_result(1, date(2024, 1, 1))]
+
+    async def execute_mock(*args, **kwargs):
+        return ExecuteResultMock(mock_data)
+
+    mock_db_session.execute = execute_mock
+
+    async with client() as ac:
+        response = await ac.get("/get_trading_results", params={"limit": 5})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_get_trading_results_invalid_cursor(client):
+    async with client() as ac:
+        response = await ac.get("/get_trading_results", params={"cursor": "garbage"})
+
+    assert response.status_code == 400
+
+
+class StreamResultMock:
+    def __init__(self, data):
+        self._data = data
+
+    async def partitions(self, size):
+        for i in range(0, len(self._data), size):
+            yield self._data[i : i + size]
+
+
+def streaming_session_factory(data):
+    session = AsyncMock()
+    session.stream_scalars = AsyncMock(return_value=StreamResultMock(data))
+    session.__aenter__.return_value = session
+    session.__aexit__.return_value = None
+    return lambda: session
+
+
+@pytest.mark.asyncio
+async def test_get_dynamics_ndjson_stream(client):
+    mock_data = [make_trading_result(i, date(2024, 1, 1)) for i in range(1, 4)]
+
+    with patch("streaming.ReadSessionLocal", streaming_session_factory(mock_data)), patch(
+        "streaming.STREAM_CHUNK_SIZE", 2
+    ):
+        async with client() as ac:
+            response = await ac.get(
+                "/get_dynamics",
+                params={"start_date": "2024-01-01", "end_date": "2024-01-31", "format": "ndjson"},
+            )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == [1, 2, 3]
+    assert lines[0]["date"] == "2024-01-01"
+    assert lines[0]["created_on"] == "2024-07-01T10:00:00"
+
+
+@pytest.mark.asyncio
+async def test_get_trading_results_csv_stream(client):
+    mock_data = [make_trading_result(i, date(2024, 1, 1)) for i in range(1, 3)]
+
+    with patch("streaming.ReadSessionLocal", streaming_session_factory(mock_data)):
+        async with client() as ac:
+            response = await ac.get("/get_trading_results", params={"format": "csv"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = response.text.splitlines()
+    assert rows[0].startswith("id,exchange_product_id,")
+    assert len(rows) == 3
+
+
+@pytest.mark.asyncio
+async def test_get_dynamics_fields_projection(client, mock_db_session):
+    mock_data = [
+        RowMock(date=date(2024, 1, 1), oil_id="A00", total=10.0, count=3, id=1),
+        RowMock(date=date(2024, 1, 2), oil_id="A00", total=20.0, count=4, id=2),
+    ]
+    statements = []
+
+    async def execute_mock(statement, *args, **kwargs):
+        statements.append(statement)
+        return ExecuteResultMock(mock_data)
+
+    mock_db_session.execute = execute_mock
+
+    async with client() as ac:
+        response = await ac.get(
+            "/get_dynamics",
+            params={
+                "start_date": "2024-01-01",
+                "end_date": "2024-01-31",
+                "fields": "date,oil_id,total,count",
+            },
+        )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"date": "2024-01-01", "oil_id": "A00", "total": 10.0, "count": 3},
+        {"date": "2024-01-02", "oil_id": "A00", "total": 20.0, "count": 4},
+    ]
+    sql = str(statements[0])
+    assert "exchange_product_name" not in sql
+    assert sql.startswith("SELECT spimex_trading_results.date, spimex_trading_results.oil_id")
+
+
+@pytest.mark.asyncio
+async def test_get_trading_results_unknown_field(client):
+    async with client() as ac:
+        response = await ac.get("/get_trading_results", params={"fields": "date,price"})
+
+    assert response.status_code == 400
+    assert "price" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_get_dynamics_aggregate(client, mock_db_session):
+    mock_data = [
+        RowMock(bucket=date(2024, 1, 1), oil_id="A00", volume=300.0, total=30000.0, count=30, vwap=100.0),
+    ]
+    statements = []
+
+    async def execute_mock(statement, *args, **kwargs):
+        statements.append(statement)
+        return ExecuteResultMock(mock_data)
+
+    mock_db_session.execute = execute_mock
+
+    async with client() as ac:
+        response = await ac.get(
+            "/get_dynamics/aggregate",
+            params={
+                "start_date": "2024-01-01",
+                "end_date": "2024-01-31",
+                "bucket": "month",
+                "group_by": "oil_id",
+            },
+        )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"bucket": "2024-01-01", "oil_id": "A00", "volume": 300.0, "total": 30000.0, "count": 30, "vwap": 100.0}
+    ]
+    sql = str(statements[0])
+    assert "date_trunc" in sql
+    assert "GROUP BY" in sql
+    assert "FROM spimex_daily_rollup" in sql
+
+
+@pytest.mark.asyncio
+async def test_get_dynamics_aggregate_unknown_dimension(client):
+    async with client() as ac:
+        response = await ac.get(
+            "/get_dynamics/aggregate",
+            params={"start_date": "2024-01-01", "end_date": "2024-01-31", "group_by": "region"},
+        )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_catalog_served_from_memory(client, mock_db_session):
+    rows = [
+        ("A100", date(2024, 1, 1), date(2024, 5, 1), 10),
+        ("B200", date(2024, 2, 1), date(2024, 3, 1), 4),
+    ]
+    refresh_session = AsyncMock()
+    refresh_session.execute = AsyncMock(return_value=ExecuteResultMock(rows))
+    await catalog.refresh_catalog(refresh_session)
+    # каждое измерение — один GROUP BY по дневным итогам
+    assert refresh_session.execute.await_count == 3
+
+    mock_db_session.execute = AsyncMock(side_effect=AssertionError("БД не должна вызываться"))
+    async with client() as ac:
+        response = await ac.get("/catalog/oil_id", params={"prefix": "a1"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["dimension"] == "oil_id"
+    assert body["values"] == [
+        {"value": "A100", "first_trade_date": "2024-01-01", "last_trade_date": "2024-05-01", "rows": 10}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_catalog_backs_off_while_db_down(client):
+    session_factory = MagicMock(side_effect=ConnectionError("БД недоступна"))
+    with patch.object(catalog, "_refreshed_at", None), patch.object(catalog, "_failed_at", None), patch(
+        "src.app.main.ReadSessionLocal", session_factory
+    ), patch("src.app.main.current_data_version", new=AsyncMock(return_value=None)):
+        async with client() as ac:
+            for _ in range(3):
+                response = await ac.get("/catalog/oil_id")
+                assert response.status_code == 200
+                assert response.json()["refreshed_at"] is None
+            # Одна попытка на CATALOG_RETRY_INTERVAL, а не на каждый запрос
+            assert session_factory.call_count == 1
+
+            with patch.object(catalog, "CATALOG_RETRY_INTERVAL", 0):
+                await ac.get("/catalog/oil_id")
+            assert session_factory.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_catalog_refreshed_when_data_version_changes():
+    refresh_session = AsyncMock()
+    refresh_session.execute = AsyncMock(return_value=ExecuteResultMock([]))
+    await catalog.refresh_catalog(refresh_session, data_version=3)
+
+    with patch("src.app.main.load_catalog", new_callable=AsyncMock) as mock_load, patch(
+        "src.app.main.current_data_version", new=AsyncMock(return_value=DataVersion(3, None))
+    ):
+        await refresh_catalog_if_stale()
+        mock_load.assert_not_awaited()
+
+    # Загрузка в другом процессе увеличила версию — каталог этого воркера перечитывается
+    with patch("src.app.main.load_catalog", new_callable=AsyncMock) as mock_load, patch(
+        "src.app.main.current_data_version", new=AsyncMock(return_value=DataVersion(4, None))
+    ):
+        await refresh_catalog_if_stale()
+        mock_load.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client, mock_db_session):
+    mock_db_session.execute = AsyncMock(return_value=ExecuteResultMock([]))
+
+    async with client() as ac:
+        await ac.get("/get_dynamics", params={"start_date": "2024-01-01", "end_date": "2024-01-02"})
+        response = await ac.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert "# TYPE spimex_http_request_duration_seconds histogram" in body
+    assert (
+        'spimex_http_request_duration_seconds_count{method="GET",route="/get_dynamics",status="200"}' in body
+    )
+    assert 'spimex_endpoint_rows_bucket{endpoint="dynamics",le="0"}' in body
+    assert "# TYPE spimex_cache_hits_total counter" in body
+    assert "# TYPE spimex_db_query_duration_seconds histogram" in body
+    assert 'spimex_local_cache{stat="entries"}' in body
+
+
+def test_metrics_text_format():
+    registry = dict(metrics.REGISTRY)
+    try:
+        counter = metrics.Counter("test_events_total", "События", ("kind",))
+        counter.inc(kind='a"b')
+        counter.inc(2, kind='a"b')
+        histogram = metrics.Histogram("test_latency_seconds", "Задержка", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        assert counter.render().splitlines() == [
+            "# HELP test_events_total События",
+            "# TYPE test_events_total counter",
+            'test_events_total{kind="a\\"b"} 3',
+        ]
+        assert histogram.render().splitlines()[2:] == [
+            'test_latency_seconds_bucket{le="0.1"} 1',
+            'test_latency_seconds_bucket{le="1"} 2',
+            'test_latency_seconds_bucket{le="+Inf"} 3',
+            "test_latency_seconds_sum 5.55",
+            "test_latency_seconds_count 3",
+        ]
+        with pytest.raises(ValueError):
+            counter.inc(other="x")
+
+        class Incomplete(metrics._Metric):
+            type = "gauge"
+
+        # Метрика без samples() не создаётся, а не падает при отрисовке /metrics
+        with pytest.raises(TypeError):
+            Incomplete("test_incomplete", "Без samples")
+    finally:
+        metrics.REGISTRY.clear()
+        metrics.REGISTRY.update(registry)
+
+
+def test_db_query_timing_survives_failed_statements():
+    engine = create_engine("sqlite://")
+    database.instrument_engine(engine, "test")
+    observed = database.DB_QUERY_LATENCY.count(engine="test", statement="SELECT")
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(DBAPIError):
+                conn.execute(text("SELECT * FROM missing_table"))
+        conn.execute(text("SELECT 1"))
+        # Упавшие запросы не оставляют отметок времени в соединении
+        assert "query_start" not in conn.info
+
+    assert database.DB_QUERY_LATENCY.count(engine="test", statement="SELECT") == observed + 1
+
+
 @pytest.mark.asyncio
 async def test_run_spimex_async_success():
     with patch(
         "src.app.main.process_bulletins_async", new_callable=AsyncMock
-    ) as mock_process:
+    ) as mock_process, patch("src.app.main.load_catalog", new_callable=AsyncMock), patch(
+        "src.app.main.warm_popular_queries", new_callable=AsyncMock
+    ) as mock_warm:
         mock_process.return_value = None
         test_app_client = AsyncClient(app=app, base_url="http://test")
         async with test_app_client as ac:
@@ -129,3 +587,4 @@ async def test_run_spimex_async_success():
             "message": "Обработка завершена",
         }
         mock_process.assert_called_once()
+        mock_warm.assert_awaited_once()
@@ -2,8 +2,26 @@ import pytest
 from unittest.mock import AsyncMock, patch, MagicMock, mock_open
 from datetime import date, datetime
 import pandas as pd
-from src.spimex_async import parse_page_links, parse_bulletin, process_bulletins_async
+import xlrd
+import asyncio
+from src.spimex_async import (
+    insert_stage,
+    open_parse_executor,
+    parse_page_links,
+    parse_bulletin,
+    process_bulletins_async,
+    run_pipeline,
+    InsertSummary,
+)
+from src.spimex_sync import process_bulletins_sync
+from src.repository import (
+    build_partition_statements,
+    build_rollup_refresh_statements,
+    build_upsert_statement,
+    dedupe_by_natural_key,
+)
 from bs4 import BeautifulSoup
+from sqlalchemy.dialects import postgresql
 
 
 @pytest.fixture
@@ -97,10 +115,43 @@ async def test_parse_page_links():
     assert urls[0][1] == date(2024, 1, 1)
 
 
+class FakeSheet:
+    """Лист xlrd: пустые ячейки — пустые строки."""
+
+    def __init__(self, df):
+        self.rows = [["" if pd.isna(v) else v for v in row] for row in df.itertuples(index=False)]
+        self.nrows = len(self.rows)
+
+    def row_values(self, rowx):
+        return self.rows[rowx]
+
+    def col_values(self, colx, start_rowx=0, end_rowx=None):
+        return [row[colx] for row in self.rows[start_rowx:end_rowx]]
+
+
+def test_parse_bulletin_reads_only_data_block(mock_excel_data):
+    """XLS читается через xlrd выборочно, без pd.read_excel всего листа."""
+    sheet_data = pd.concat(
+        [mock_excel_data, pd.DataFrame([[None] * 7, [None, "Маклер", None, None, None, None, None]])],
+        ignore_index=True,
+    )
+    book = MagicMock()
+    book.sheet_by_index.return_value = FakeSheet(sheet_data)
+    with patch("xlrd.open_workbook", return_value=book), patch(
+        "pandas.read_excel", side_effect=AssertionError("лист не должен читаться целиком")
+    ):
+        results = parse_bulletin("test.xls", date(2024, 1, 1))
+    assert [r["exchange_product_id"] for r in results] == ["A001-B1-T", "B002-B2-T"]
+    assert results[1]["volume"] == 200.0 and results[1]["count"] == 20
+    book.release_resources.assert_called_once()
+
+
 def test_parse_bulletin(mock_excel_data):
-    """Тест функции parse_bulletin."""
-    with patch("pandas.read_excel", return_value=mock_excel_data):
-        with patch("src.spimex_async.datetime") as mock_dt:
+    """Тест функции parse_bulletin: не-BIFF файл читается через pandas целиком."""
+    with patch("xlrd.open_workbook", side_effect=xlrd.XLRDError("Excel xlsx file; not supported")), patch(
+        "pandas.read_excel", return_value=mock_excel_data
+    ):
+        with patch("bulletin_parser.datetime") as mock_dt:
             mock_dt.now.return_value = datetime(2024, 7, 1, 10, 0, 0)
             mock_dt.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
             file_path = "test.xls"
@@ -113,6 +164,73 @@ def test_parse_bulletin(mock_excel_data):
             assert results[1]["date"] == trade_date
             assert results[0]["count"] == 10
             assert results[1]["count"] == 20
+            assert results[0]["delivery_basis_id"] == "B1"
+            assert results[0]["delivery_type_id"] == "T"
+            assert isinstance(results[0]["volume"], float)
+            assert "id" not in results[0]
+
+
+def test_build_upsert_statement_uses_natural_key():
+    """Upsert конфликтует по (date, exchange_product_id) и обновляет значения."""
+    now = datetime(2024, 7, 1, 10, 0, 0)
+    record = {
+        "exchange_product_id": "A001-B1-T",
+        "exchange_product_name": "Нефть А",
+        "oil_id": "UNKNOWN",
+        "delivery_basis_id": "B1",
+        "delivery_basis_name": "БАЗИС 1",
+        "delivery_type_id": "T",
+        "volume": 100.0,
+        "total": 10000.0,
+        "count": 10,
+        "date": date(2024, 1, 1),
+        "created_on": now,
+        "updated_on": now,
+    }
+    sql = str(
+        build_upsert_statement([record, {**record, "count": 11}]).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert "ON CONFLICT (date, exchange_product_id) DO UPDATE" in sql
+    assert "updated_on = excluded.updated_on" in sql
+    assert "created_on = excluded.created_on" not in sql
+
+
+def test_build_rollup_refresh_statements_limited_to_dates():
+    """Итоги пересчитываются только за переданные торговые даты."""
+    delete_stmt, insert_stmt = build_rollup_refresh_statements([date(2024, 1, 1)])
+    delete_sql = str(delete_stmt.compile(dialect=postgresql.dialect()))
+    insert_sql = str(insert_stmt.compile(dialect=postgresql.dialect()))
+    assert delete_sql.startswith("DELETE FROM spimex_daily_rollup WHERE spimex_daily_rollup.date IN")
+    assert insert_sql.startswith("INSERT INTO spimex_daily_rollup")
+    assert "WHERE spimex_trading_results.date IN" in insert_sql
+    assert "GROUP BY" in insert_sql
+
+
+def test_build_partition_statements_one_per_month():
+    """Для каждого месяца создаётся ровно одна секция с границами месяца."""
+    statements = build_partition_statements(
+        [date(2024, 12, 2), date(2024, 12, 30), date(2025, 1, 9)]
+    )
+    sql = [str(stmt) for stmt in statements]
+    assert sql == [
+        "CREATE TABLE IF NOT EXISTS spimex_trading_results_p202412 PARTITION OF "
+        "spimex_trading_results FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')",
+        "CREATE TABLE IF NOT EXISTS spimex_trading_results_p202501 PARTITION OF "
+        "spimex_trading_results FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')",
+    ]
+
+
+def test_dedupe_by_natural_key_keeps_last():
+    """Дубликаты внутри батча схлопываются до последней записи."""
+    records = [
+        {"date": date(2024, 1, 1), "exchange_product_id": "A", "count": 1},
+        {"date": date(2024, 1, 1), "exchange_product_id": "B", "count": 2},
+        {"date": date(2024, 1, 1), "exchange_product_id": "A", "count": 3},
+    ]
+    result = dedupe_by_natural_key(records)
+    assert [r["count"] for r in result] == [3, 2]
 
 
 @pytest.mark.asyncio
@@ -132,11 +250,20 @@ async def test_process_bulletins_async(
             date(2024, 1, 2),
         ),
     ]
-    with patch("src.spimex_async.get_bulletin_urls", return_value=bulletin_urls), patch(
+    with patch(
+        "src.spimex_async.get_bulletin_urls", return_value=bulletin_urls
+    ) as mock_urls, patch(
         "src.spimex_async.download_bulletin", new_callable=AsyncMock, return_value=True
-    ), patch("pandas.read_excel", return_value=mock_excel_data), patch(
+    ) as mock_download, patch("pandas.read_excel", return_value=mock_excel_data), patch(
+        "src.spimex_async.invalidate_tags", new_callable=AsyncMock
+    ) as mock_invalidate, patch(
+        "src.spimex_async.bump_data_version", new_callable=AsyncMock
+    ) as mock_bump, patch(
         "src.spimex_async.datetime"
-    ) as mock_dt:
+    ) as mock_dt, patch(
+        # Моки pandas не видны дочерним процессам — разбор в потоке
+        "src.spimex_async.SPIMEX_PARSE_WORKERS", 0
+    ):
         mock_dt.now.return_value = datetime(2024, 7, 1, 10, 0, 0)
         mock_dt.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
         start_date = date(2024, 1, 1)
@@ -146,4 +273,145 @@ async def test_process_bulletins_async(
         mock_makedirs.assert_called_once_with(output_dir, exist_ok=True)
         assert m_open_async.call_count == 0
         assert m_open_sync.call_count == 0
-        assert mock_async_session.execute.call_count >= 1
+        # секция за январь, затем на каждый файл: upsert, удаление и вставка дневных итогов
+        assert mock_async_session.execute.call_count == 7
+        # секции фиксируются отдельно, до вставки данных, и каждый файл — своей транзакцией
+        assert mock_async_session.commit.await_count == 3
+        assert "PARTITION OF" in str(mock_async_session.execute.await_args_list[0].args[0])
+        tags = mock_invalidate.await_args.args[0]
+        assert "latest" in tags and "month:2024-01" in tags
+        assert not any(tag.startswith("month:2023") for tag in tags)
+        mock_bump.assert_awaited_once()
+        # Все HTTP-запросы прогона идут через одну сессию, закрытую по окончании
+        http_session = mock_urls.await_args.args[0]
+        assert {call.args[0] for call in mock_download.await_args_list} == {http_session}
+        assert http_session.closed
+
+
+@pytest.mark.asyncio
+async def test_parse_executor_shutdown_does_not_wait_on_error():
+    """При ошибке пул закрывается без ожидания, при штатном выходе — не в event loop."""
+    executor = MagicMock()
+    with patch("src.spimex_async.create_parse_executor", return_value=executor):
+        with pytest.raises(RuntimeError):
+            async with open_parse_executor(4, 4):
+                raise RuntimeError("ошибка вставки")
+        executor.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+        executor.reset_mock()
+        with patch("src.spimex_async.asyncio.to_thread", new_callable=AsyncMock) as mock_to_thread:
+            async with open_parse_executor(4, 4):
+                pass
+        mock_to_thread.assert_awaited_once_with(executor.shutdown)
+
+
+@pytest.mark.asyncio
+async def test_run_pipeline_logs_all_stage_errors(caplog):
+    """Наружу уходит первая ошибка этапа, в лог — все."""
+    async def failing_download(*args):
+        raise ConnectionError("загрузка")
+
+    async def failing_insert(*args):
+        try:
+            await asyncio.sleep(1)
+        finally:
+            raise ValueError("вставка")
+
+    with patch("src.spimex_async.download_stage", side_effect=failing_download), patch(
+        "src.spimex_async.insert_stage", side_effect=failing_insert
+    ), patch("src.spimex_async.SPIMEX_PARSE_WORKERS", 0):
+        with pytest.raises(ConnectionError):
+            await run_pipeline(None, [("url", date(2024, 1, 1))], "temp_bulletins", None, InsertSummary())
+
+    assert "ошибок этапов: 2" in caplog.text
+    assert "ConnectionError: загрузка" in caplog.text and "ValueError: вставка" in caplog.text
+
+
+def test_process_bulletins_sync_invalidates_cache(mock_file_system, mock_db_session):
+    """Синхронная загрузка сбрасывает кеш по тегам и увеличивает версию данных."""
+    _, mock_sync_session = mock_db_session
+    records = [{"date": date(2024, 1, 1), "exchange_product_id": "A001-B1-T", "oil_id": "A001"}]
+    with patch(
+        "src.spimex_sync.sync_get_bulletin_urls",
+        return_value=[("https://spimex.com/oil_xls_20240101.xls", date(2024, 1, 1))],
+    ), patch("src.spimex_sync.requests.get"), patch(
+        "src.spimex_sync.parse_bulletin", return_value=records
+    ), patch(
+        "src.spimex_sync.invalidate_tags", new_callable=AsyncMock
+    ) as mock_invalidate, patch(
+        "src.spimex_sync.bump_data_version", new_callable=AsyncMock
+    ) as mock_bump, patch(
+        "src.spimex_sync.close_redis", new_callable=AsyncMock
+    ) as mock_close:
+        process_bulletins_sync(date(2024, 1, 1), date(2024, 1, 1), "temp_bulletins")
+    # секции, батч и дневные итоги — три отдельные транзакции
+    assert mock_sync_session.commit.call_count == 3
+    assert "PARTITION OF" in str(mock_sync_session.execute.call_args_list[0].args[0])
+    tags = mock_invalidate.await_args.args[0]
+    assert "latest" in tags and "month:2024-01:oil:A001" in tags
+    mock_bump.assert_awaited_once()
+    mock_close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_process_bulletins_async_invalidates_committed_files_on_error(mock_file_system, mock_db_session):
+    """Файлы, зафиксированные до ошибки, остаются в базе — кеш по ним сбрасывается."""
+    mock_async_session, _ = mock_db_session
+    committed = [{"date": date(2024, 1, 1), "exchange_product_id": "A001-B1-T", "oil_id": "A001"}]
+
+    async def failing_pipeline(http_session, bulletin_urls, output_dir, session, summary):
+        summary.add(committed, 1)
+        raise ConnectionError("обрыв загрузки")
+
+    with patch(
+        "src.spimex_async.get_bulletin_urls", return_value=[("url1", date(2024, 1, 1)), ("url2", date(2024, 1, 2))]
+    ), patch("src.spimex_async.run_pipeline", side_effect=failing_pipeline), patch(
+        "src.spimex_async.invalidate_tags", new_callable=AsyncMock
+    ) as mock_invalidate, patch(
+        "src.spimex_async.bump_data_version", new_callable=AsyncMock
+    ) as mock_bump:
+        await process_bulletins_async(date(2024, 1, 1), date(2024, 1, 2), "temp_bulletins")
+
+    mock_async_session.rollback.assert_awaited_once()
+    assert "month:2024-01:oil:A001" in mock_invalidate.await_args.args[0]
+    mock_bump.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_insert_stage_commits_each_file_as_it_arrives():
+    """Каждый файл режется на батчи, пересчитывает свои дневные итоги и фиксируется отдельно."""
+    def record(day, product):
+        return {"date": date(2024, 1, day), "exchange_product_id": product, "oil_id": "A100"}
+
+    queue = asyncio.Queue(maxsize=1)
+    session = AsyncMock()
+    saved = []
+    rollups = []
+
+    async def save_batch(session, batch):
+        saved.append([r["exchange_product_id"] for r in batch])
+
+    async def refresh_daily_rollup(session, trade_dates):
+        rollups.append(trade_dates)
+
+    async def produce():
+        await queue.put([record(1, "A"), record(1, "B"), record(1, "C")])
+        # Очередь на один файл: второй ждёт, пока первый не взят на вставку
+        await queue.put([record(2, "D")])
+        # Первый файл зафиксирован до прихода второго — транзакция не ждёт загрузку
+        assert saved == [["A", "B"], ["C"]]
+        assert session.commit.await_count == 1
+        await queue.put(None)
+
+    summary = InsertSummary()
+    with patch("src.spimex_async.save_batch", side_effect=save_batch), patch(
+        "src.spimex_async.refresh_daily_rollup", side_effect=refresh_daily_rollup
+    ):
+        await asyncio.gather(insert_stage(session, queue, summary, batch_size=2), produce())
+
+    assert saved == [["A", "B"], ["C"], ["D"]]
+    assert rollups == [[date(2024, 1, 1)], [date(2024, 1, 2)]]
+    assert session.commit.await_count == 2
+    assert summary.rows == 4 and summary.batches == 3 and summary.files == 2
+    assert summary.trade_dates == {date(2024, 1, 1), date(2024, 1, 2)}
+    assert "month:2024-01:oil:A100" in summary.tags